@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hmac
 import os
 from fastapi import Header, HTTPException, Security
 from fastapi.security import APIKeyHeader
@@ -10,43 +11,53 @@ API_KEY_HEADER = "X-API-Key"
 # Get API key from environment variable
 # Clients must send this exact key in the X-API-Key header
 API_KEY = os.getenv("API_KEY") or os.getenv("VEE_CHATBOT_API_KEY")
+# Encoded once at import time so the per-request comparison doesn't re-encode it
+API_KEY_BYTES = API_KEY.encode("utf-8") if API_KEY else None
 
 # Security scheme for FastAPI
 api_key_header = APIKeyHeader(name=API_KEY_HEADER, auto_error=False)
 
 
-def verify_api_key(api_key: str | None = Security(api_key_header)) -> str:
-    """
-    Verify API key from request header.
-    
-    Args:
-        api_key: The API key from the X-API-Key header
+# The dev/auth decision is made once at import time, so the per-request
+# dependency has no configuration checks left in it
+if not API_KEY:
+    def verify_api_key(api_key: str | None = Security(api_key_header)) -> str:
+        """
+        Development mode: no API key is configured, so all requests are allowed.
+        This is useful for local testing without authentication.
         
-    Returns:
-        The verified API key
-        
-    Raises:
-        HTTPException: If API key is missing or invalid
-    """
-    # If no API key is configured, allow all requests (development mode)
-    # This is useful for local testing without authentication
-    if not API_KEY:
+        Returns:
+            "dev"
+        """
         return "dev"
-    
-    # Check if API key is provided and matches
-    if not api_key:
-        raise HTTPException(
-            status_code=401,
-            detail="Missing API key. Please provide a valid X-API-Key header.",
-            headers={"WWW-Authenticate": "ApiKey"},
-        )
-    
-    if api_key != API_KEY:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid API key. Please provide a valid X-API-Key header.",
-            headers={"WWW-Authenticate": "ApiKey"},
-        )
-    
-    return api_key
-
+else:
+    def verify_api_key(api_key: str | None = Security(api_key_header)) -> str:
+        """
+        Verify API key from request header.
+        
+        Args:
+            api_key: The API key from the X-API-Key header
+            
+        Returns:
+            The verified API key
+            
+        Raises:
+            HTTPException: If API key is missing or invalid
+        """
+        # Check if API key is provided and matches
+        if not api_key:
+            raise HTTPException(
+                status_code=401,
+                detail="Missing API key. Please provide a valid X-API-Key header.",
+                headers={"WWW-Authenticate": "ApiKey"},
+            )
+        
+        # Constant-time comparison so response latency doesn't leak how much of the key matched
+        if not hmac.compare_digest(api_key.encode("utf-8"), API_KEY_BYTES):
+            raise HTTPException(
+                status_code=401,
+                detail="Invalid API key. Please provide a valid X-API-Key header.",
+                headers={"WWW-Authenticate": "ApiKey"},
+            )
+        
+        return api_key
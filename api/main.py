@@ -1,26 +1,38 @@
 from __future__ import annotations
 
+import asyncio
 import html
-import re
-import uuid
+import io
+import json
+import logging
+import secrets
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
+from urllib.parse import quote
 
 import base64
 
 from fastapi import Depends, FastAPI, File, Form, HTTPException, Query, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
+from pydantic import BaseModel, ValidationError
+from pydantic_core import to_json
+from starlette.concurrency import iterate_in_threadpool
 from starlette.requests import Request
-from starlette.responses import Response as StarletteResponse
 import time
 
 from app.chatbot import bot
 from app.config import settings
 from app.conversation_manager import conversation_manager
-from app.image_storage import save_image
+from app.image_storage import delete_image, save_image
+from app.image_utils import IMAGE_SIGNATURE_LENGTH, b64encode_to_str, encode_image_data_url_cached, has_image_signature
 from app.ingest import ingest_dataset
+from app.llm import async_http_client, llm_client
+from app.logger import api_logger, conversation_logger
 from app.mysql_ingestor import ingest_mysql
+from app.response_cache import response_cache
 from app.voice_utils import get_voice_processor
 from api.auth import verify_api_key
 from api.schemas import (
@@ -30,12 +42,91 @@ from api.schemas import (
     ConversationListResponse,
     ConversationMessage,
     ConversationSummary,
+    HistoryDays,
     HTMLChatResponse,
-    ImageChatRequest,
     VoiceChatResponse,
 )
 
-app = FastAPI(title="Vee Food Chatbot", version="0.1.0")
+logger = logging.getLogger(__name__)
+
+
+def _seed_knowledge_base() -> None:
+    """Load the knowledge base from JSON (and optionally MySQL). Blocking."""
+    try:
+        # Always load JSON data if available
+        ingest_dataset(reset=False)
+    except FileNotFoundError:
+        # JSON file is optional if MySQL is used
+        pass
+    except Exception as e:
+        # Log but don't fail startup if JSON ingestion fails
+        logger.warning(f"JSON ingestion on startup failed: {e}")
+    
+    # Optionally load MySQL data on startup
+    if settings.ingest_mysql_on_startup:
+        try:
+            ingest_mysql(reset=False)
+        except Exception as e:
+            # Log but don't fail startup if MySQL ingestion fails
+            logger.warning(f"MySQL ingestion on startup failed: {e}")
+
+
+async def _warmup(app: FastAPI) -> None:
+    """
+    Seed the knowledge base in a worker thread, then mark the app as ready.
+    Meanwhile connections to the LLM provider are opened so the first chat skips the handshake.
+    """
+    loop = asyncio.get_running_loop()
+    connect = asyncio.gather(
+        loop.run_in_executor(None, llm_client.warm_up),
+        llm_client.awarm_up(),
+    )
+    try:
+        await loop.run_in_executor(None, _seed_knowledge_base)
+    finally:
+        app.state.ready = True
+    await connect
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load knowledge base on startup.
+    Ingestion runs in the background so the server accepts requests immediately;
+    chat endpoints return 503 until it has finished (see require_ready).
+    """
+    app.state.ready = False
+    # Create the voice processor once up front so a misconfiguration shows up in the startup logs
+    try:
+        get_voice_processor()
+    except Exception as e:
+        # Voice endpoints are optional; they keep returning 500 until it is configured
+        logger.warning(f"Voice processor initialization failed: {e}")
+    # Keep a reference so the task isn't garbage collected while running
+    app.state.warmup_task = asyncio.create_task(_warmup(app))
+    yield
+    # Stop a warm-up still seeding the knowledge base or opening connections
+    warmup_task = app.state.warmup_task
+    warmup_task.cancel()
+    try:
+        await warmup_task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.warning(f"Warm-up failed: {e}")
+    # Don't lose conversation logs still waiting to be uploaded to S3
+    await asyncio.to_thread(conversation_logger.close)
+    # Close the pooled connections to the LLM provider (the sync client is closed at exit)
+    await async_http_client.aclose()
+
+
+# orjson serializes response bodies (HTML strings, base64 audio) much faster than the stdlib encoder
+app = FastAPI(
+    title="Vee Food Chatbot",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # Mount static file serving for uploaded images
 # Create uploads/images directory if it doesn't exist
@@ -46,239 +137,734 @@ uploads_dir.mkdir(parents=True, exist_ok=True)
 app.mount("/uploads/images", StaticFiles(directory=str(uploads_dir)), name="images")
 
 
-class APILoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware to log all API requests and responses."""
+# Request bodies larger than this are logged by size only
+API_LOG_BODY_LIMIT = 10000
+
+
+def _describe_request_body(body: bytes, size: int, content_type: str) -> dict | None:
+    """
+    Summarize a request body for the API log.
+    
+    Args:
+        body: Copy of the body, empty when it was not kept (uploads or oversized bodies)
+        size: Total number of body bytes received
+        content_type: Request Content-Type header
+        
+    Returns:
+        The parsed JSON body, or a dict describing its type and size
+    """
+    if not size:
+        return None
+    if content_type.startswith("multipart/form-data"):
+        return {"type": "multipart/form-data", "size": size}
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {"type": "form-urlencoded", "size": size}
+    if len(body) < size:
+        return {"type": "raw", "size": size, "truncated": True}
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError:
+        # Not JSON: show a preview of the text content
+        preview = body[:200].decode('utf-8', errors='ignore')
+        return {"type": "raw", "size": size, "preview": preview}
+
+
+def _describe_response_body(body: bytes) -> dict | None:
+    """Summarize a response body for the API log: parsed JSON, else its size and a short preview."""
+    if not body:
+        return None
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError:
+        # If response is too large, just log size
+        if len(body) > API_LOG_BODY_LIMIT:
+            return {"type": "non-json", "size": len(body), "truncated": True}
+        preview = body[:500].decode('utf-8', errors='ignore')
+        return {"type": "non-json", "size": len(body), "preview": preview}
+
+
+class APILoggingMiddleware:
+    """
+    Middleware to log all API requests and responses.
+    
+    Written as plain ASGI rather than BaseHTTPMiddleware so body chunks are passed on as
+    they arrive: streamed answers (/chat/stream) reach the client piece by piece, and upload
+    bodies are only counted, never copied, leaving the endpoint as their first reader.
+    """
+    
+    def __init__(self, app):
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next):
-        # Skip logging for static files and docs
-        if request.url.path.startswith("/uploads/") or request.url.path.startswith("/docs") or request.url.path.startswith("/redoc") or request.url.path.startswith("/openapi.json"):
-            return await call_next(request)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        path = request.url.path
+        # Skip logging for static files, docs and readiness probes
+        if path == "/readyz" or path.startswith("/uploads/") or path.startswith("/docs") or path.startswith("/redoc") or path.startswith("/openapi.json"):
+            await self.app(scope, receive, send)
+            return
         
         start_time = time.time()
+        content_type = request.headers.get("content-type", "")
+        # Only small non-form bodies (the JSON chat requests) are worth keeping for the log
+        keep_request_body = not content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded"))
+        request_body = bytearray()
+        request_size = 0
+        response_body = bytearray()
+        status_code = 500
+        
+        async def logged_receive():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                request_size += len(chunk)
+                if keep_request_body and request_size <= API_LOG_BODY_LIMIT:
+                    request_body.extend(chunk)
+            return message
+        
+        async def logged_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_body.extend(message.get("body", b""))
+            await send(message)
         
-        # Read request body
-        request_body = None
-        if request.method in ["POST", "PUT", "PATCH"]:
-            body = await request.body()
-            if body:
-                try:
-                    # Try to parse as JSON
-                    import json
-                    request_body = json.loads(body.decode('utf-8'))
-                except:
-                    # If not JSON, check if it's form data
-                    content_type = request.headers.get("content-type", "")
-                    if content_type.startswith("multipart/form-data"):
-                        request_body = {"type": "multipart/form-data", "size": len(body)}
-                    elif content_type.startswith("application/x-www-form-urlencoded"):
-                        request_body = {"type": "form-urlencoded", "size": len(body)}
-                    else:
-                        # Try to show preview for text content
-                        try:
-                            preview = body[:200].decode('utf-8', errors='ignore')
-                            request_body = {"type": "raw", "size": len(body), "preview": preview}
-                        except:
-                            request_body = {"type": "binary", "size": len(body)}
-        
-        # Get query parameters
-        query_params = dict(request.query_params)
-        
-        # Process request
-        response = None
         error = None
         try:
-            response = await call_next(request)
+            await self.app(scope, logged_receive, logged_send)
         except Exception as e:
             error = str(e)
+            status_code = 500
             raise
         finally:
             processing_time = (time.time() - start_time) * 1000  # Convert to ms
             
-            # Read response body
-            response_body = None
-            if response:
-                response_body_bytes = b""
-                async for chunk in response.body_iterator:
-                    response_body_bytes += chunk
-                
-                # Recreate response with the body
-                response = StarletteResponse(
-                    content=response_body_bytes,
-                    status_code=response.status_code,
-                    headers=dict(response.headers),
-                    media_type=response.media_type
-                )
-                
-                if response_body_bytes:
-                    try:
-                        import json
-                        response_body = json.loads(response_body_bytes.decode('utf-8'))
-                    except:
-                        # If response is too large, just log size
-                        if len(response_body_bytes) > 10000:
-                            response_body = {"type": "non-json", "size": len(response_body_bytes), "truncated": True}
-                        else:
-                            try:
-                                preview = response_body_bytes[:500].decode('utf-8', errors='ignore')
-                                response_body = {"type": "non-json", "size": len(response_body_bytes), "preview": preview}
-                            except:
-                                response_body = {"type": "binary", "size": len(response_body_bytes)}
-            
             # Log the request/response
-            from app.logger import api_logger
             api_logger.log_request_response(
                 method=request.method,
-                path=str(request.url.path),
-                status_code=response.status_code if response else 500,
+                path=path,
+                status_code=status_code,
                 request_headers=dict(request.headers),
-                request_body=request_body,
-                query_params=query_params,
-                response_body=response_body,
+                request_body=_describe_request_body(bytes(request_body), request_size, content_type),
+                query_params=dict(request.query_params),
+                response_body=_describe_response_body(bytes(response_body)),
                 processing_time_ms=round(processing_time, 2),
                 error=error,
             )
+
+
+# Uploads are copied out of Starlette's spooled file in fixed-size chunks, so a file over its
+# limit is rejected as soon as it passes it; RequestSizeLimitMiddleware caps what gets spooled
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_BYTES = settings.max_image_size_mb * 1024 * 1024
+MAX_AUDIO_BYTES = settings.max_audio_size_mb * 1024 * 1024
+# Whole request body allowance: base64 inflates the image by 4/3, plus multipart framing
+MAX_IMAGE_REQUEST_BYTES = MAX_IMAGE_BYTES * 4 // 3 + 64 * 1024
+# Audio is sent as a plain file upload, so only the multipart framing is added
+MAX_AUDIO_REQUEST_BYTES = MAX_AUDIO_BYTES + 64 * 1024
+
+# Whole request body limits for the upload endpoints: (max bytes, 413 detail)
+UPLOAD_REQUEST_LIMITS = {
+    "/chat/image": (MAX_IMAGE_REQUEST_BYTES, f"Image too large. Maximum size: {settings.max_image_size_mb}MB"),
+    "/chat/image/html": (MAX_IMAGE_REQUEST_BYTES, f"Image too large. Maximum size: {settings.max_image_size_mb}MB"),
+    "/chat/voice": (MAX_AUDIO_REQUEST_BYTES, f"Audio file too large. Maximum size: {settings.max_audio_size_mb}MB"),
+    "/chat/voice/audio": (MAX_AUDIO_REQUEST_BYTES, f"Audio file too large. Maximum size: {settings.max_audio_size_mb}MB"),
+    "/chat/voice/text": (MAX_AUDIO_REQUEST_BYTES, f"Audio file too large. Maximum size: {settings.max_audio_size_mb}MB"),
+}
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject upload requests whose body is larger than the endpoint accepts, before anything reads it.
+    
+    The Content-Length header is checked up front. Bodies sent without one (chunked transfer)
+    are counted as they arrive and cut off with a 413 as soon as they pass the limit, so
+    Starlette never parses or spools more than the limit.
+    """
+    
+    def __init__(self, app, limits: dict[str, tuple[int, str]]):
+        self.app = app
+        self.limits = limits
+    
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        max_bytes, detail = limit
+        
+        content_length = Request(scope).headers.get("content-length")
+        if content_length is not None:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                await ORJSONResponse({"detail": "Invalid Content-Length header"}, status_code=400)(scope, receive, send)
+                return
+            if declared > max_bytes:
+                await ORJSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+                return
+        
+        received = 0
+        too_large = False
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    too_large = True
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        async def guarded_send(message):
+            nonlocal response_started
+            # Once the body has been cut off, the app's own answer is replaced by the 413 below
+            if too_large:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
         
-        return response
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not too_large:
+                raise
+        if too_large and not response_started:
+            await ORJSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
 
-# Add middleware
+# Add middleware (the last one added runs first, so every request is logged, rejected ones included)
+app.add_middleware(RequestSizeLimitMiddleware, limits=UPLOAD_REQUEST_LIMITS)
 app.add_middleware(APILoggingMiddleware)
 
 
+async def read_image_upload(upload: UploadFile) -> bytes:
+    """
+    Read an uploaded image after checking its leading bytes are a real image.
+    
+    Raises:
+        HTTPException: 415 if the file is not a JPEG, PNG, GIF or WEBP image,
+            413 if it is larger than MAX_IMAGE_BYTES
+    """
+    header = await upload.read(IMAGE_SIGNATURE_LENGTH)
+    if not has_image_signature(header):
+        raise HTTPException(status_code=415, detail="Unsupported image format. Supported formats: JPEG, PNG, GIF, WEBP")
+    return await read_upload_limited(upload, MAX_IMAGE_BYTES, initial=header)
+
+
+async def read_upload_limited(
+    upload: UploadFile,
+    max_bytes: int,
+    initial: bytes = b"",
+    label: str = "Image",
+) -> bytes:
+    """
+    Read an uploaded file in chunks, rejecting it as soon as it exceeds max_bytes.
+    
+    Args:
+        upload: The uploaded file
+        max_bytes: Maximum number of bytes accepted
+        initial: Bytes already read from the upload (e.g. a signature peek)
+        label: What the upload is, for the error message ("Image", "Audio file")
+    
+    Raises:
+        HTTPException: 413 if the upload is larger than max_bytes
+    """
+    buffer = io.BytesIO()
+    buffer.write(initial)
+    total = len(initial)
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{label} too large. Maximum size: {max_bytes // (1024 * 1024)}MB",
+            )
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+# Indexed by header level (1-3)
+_HEADER_OPEN_TAGS = ("", "<h1>", "<h2>", "<h3>")
+_HEADER_CLOSE_TAGS = ("", "</h1>", "</h2>", "</h3>")
+
+
+def _find_italic_end(line: str, start: int) -> int:
+    """
+    Find the '*' closing an italic whose content starts at start, or -1 if there is none.
+    
+    Bold pairs ('**text**') inside the italic are skipped over, so in
+    '*italic with **bold** inside*' the closing '*' is the last one.
+    """
+    end = line.find("*", start)
+    while end != -1:
+        if not line.startswith("*", end + 1):
+            return end
+        # '**' opens bold inside the italic: continue after its closing '**'
+        bold_end = line.find("**", end + 3)
+        if bold_end == -1:
+            return -1
+        end = line.find("*", bold_end + 2)
+    return -1
+
+
+def _closes_inner_italic(content: str) -> bool:
+    """Whether a '*' right after content would close an italic opened inside it."""
+    extended = content + "*"
+    start = content.find("*")
+    while start != -1:
+        if not content.startswith("*", start + 1) and (start == 0 or content[start - 1] != "*"):
+            end = _find_italic_end(extended, start + 1)
+            if end == len(content):
+                return True
+            if end != -1:
+                # Italic closed within content: look for another one after it
+                start = content.find("*", end + 1)
+                continue
+        start = content.find("*", start + 1)
+    return False
+
+
+def _render_emphasis(line: str, parts: list[str]) -> None:
+    """
+    Convert bold (**text**) and italic (*text*) within a single line, appending to parts.
+    
+    A hand-written scanner that jumps between '*' characters with str.find,
+    so text without emphasis is copied through untouched. Italic follows the
+    usual rule of not touching '*' characters that are part of '**', and
+    either kind may contain the other ('***text***' renders as both).
+    """
+    if "*" not in line:
+        parts.append(line)
+        return
+    length = len(line)
+    copied = 0
+    i = line.find("*")
+    while i != -1:
+        next_char = line[i + 1] if i + 1 < length else ""
+        if next_char == "*":
+            # Bold: the first '**' after at least one character of content
+            end = line.find("**", i + 3)
+            if end != -1:
+                # In a closing run like '***' the bold ends on the last two '*' only when
+                # the first one closes an italic opened inside it ('**bold *italic***')
+                if line.startswith("*", end + 2) and _closes_inner_italic(line[i + 2:end]):
+                    end += 1
+                parts.append(line[copied:i])
+                parts.append("<strong>")
+                _render_emphasis(line[i + 2:end], parts)
+                parts.append("</strong>")
+                copied = end + 2
+                i = line.find("*", copied)
+                continue
+        elif next_char and (i == 0 or line[i - 1] != "*"):
+            # Italic: content runs to the next single '*', and may contain bold
+            end = _find_italic_end(line, i + 1)
+            if end != -1:
+                parts.append(line[copied:i])
+                parts.append("<em>")
+                _render_emphasis(line[i + 1:end], parts)
+                parts.append("</em>")
+                copied = end + 1
+                i = line.find("*", copied)
+                continue
+        i = line.find("*", i + 1)
+    parts.append(line[copied:])
+
+
+def _render_line(line: str, parts: list[str]) -> None:
+    """Render one (already escaped) line into parts, turning '#', '##' and '###' prefixes into headers."""
+    if line.startswith("#"):
+        level = len(line) - len(line.lstrip("#"))
+        # Header needs 1-3 '#', a space, and some text
+        if level <= 3 and line[level:level + 1] == " " and len(line) > level + 1:
+            parts.append(_HEADER_OPEN_TAGS[level])
+            _render_emphasis(line[level + 1:], parts)
+            parts.append(_HEADER_CLOSE_TAGS[level])
+            return
+    _render_emphasis(line, parts)
+
+
 def markdown_to_html(text: str) -> str:
     """
     Convert Markdown formatting to HTML.
     Converts headers (#, ##, ###), bold (**text**), and italic (*text*) to HTML.
-    """
-    # Convert Markdown headers to HTML
-    # ### Header -> <h3>Header</h3>
-    html_content = re.sub(r'^### (.+)$', r'<h3>\1</h3>', text, flags=re.MULTILINE)
-    # ## Header -> <h2>Header</h2>
-    html_content = re.sub(r'^## (.+)$', r'<h2>\1</h2>', html_content, flags=re.MULTILINE)
-    # # Header -> <h1>Header</h1>
-    html_content = re.sub(r'^# (.+)$', r'<h1>\1</h1>', html_content, flags=re.MULTILINE)
     
-    # Convert bold (**text**)
-    html_content = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html_content)
+    Single pass over the lines: the text is escaped once up front ('#' and '*'
+    survive escaping), each line is rendered into one shared output buffer,
+    and the buffer is joined once at the end.
+    """
+    escaped = html.escape(text)
+    # Plain-text answers (no emphasis and no header lines) only need newline
+    # conversion. A '#' only matters at the start of a line, so "item #3" stays
+    # on the fast path. Checked on the raw text: escaping introduces '#' via
+    # entities like &#x27; (never at the start of a line).
+    if "*" not in text and not text.startswith("#") and "\n#" not in text:
+        return escaped.replace("\n", "<br>")
+    parts: list[str] = []
+    for index, line in enumerate(escaped.split("\n")):
+        if index:
+            parts.append("<br>")
+        _render_line(line, parts)
+    return "".join(parts)
+
+
+# Bounds how many LLM calls are in flight at once
+_llm_semaphore = asyncio.Semaphore(settings.llm_concurrency)
+
+
+async def run_llm_call(func, *args, **kwargs):
+    """
+    Await an async chatbot call on the event loop; waiting on the LLM holds no worker thread.
+    Concurrency is capped at settings.llm_concurrency to match upstream LLM limits.
+    """
+    async with _llm_semaphore:
+        return await func(*args, **kwargs)
+
+
+def new_conversation_id() -> str:
+    """Generate a random conversation ID (128 random bits as 32 hex characters)."""
+    return secrets.token_hex(16)
+
+
+async def build_history(
+    conversation_id: str,
+    user_id: str | None,
+    history_days: HistoryDays | None,
+    override: list | None = None,
+) -> list[dict]:
+    """
+    Build the conversation history passed to the chatbot.
     
-    # Convert italic (*text*)
-    html_content = re.sub(r'(?<!\*)\*([^*]+?)\*(?!\*)', r'<em>\1</em>', html_content)
+    Args:
+        conversation_id: Conversation whose in-memory turns are used
+        user_id: User whose logged conversations are merged in when history_days is set
+        history_days: 3, 7 or -1 (all history) to prepend logged history, or None
+        override: DEPRECATED manual history (ChatTurn dicts) used instead of the conversation manager
     
-    # Escape HTML and convert newlines
-    safe_html = html.escape(html_content).replace("\n", "<br>")
+    Returns:
+        List of {"user": ..., "assistant": ...} turns, oldest first
+    """
+    if override is not None:
+        # Validated ChatTurn dicts are already in the chatbot's turn format
+        history = list(override)
+    else:
+        # Already stored in the chatbot's turn format, no per-request conversion needed
+        history = conversation_manager.get_history(conversation_id)
     
-    # Unescape our HTML tags
-    safe_html = safe_html.replace("&lt;h1&gt;", "<h1>").replace("&lt;/h1&gt;", "</h1>")
-    safe_html = safe_html.replace("&lt;h2&gt;", "<h2>").replace("&lt;/h2&gt;", "</h2>")
-    safe_html = safe_html.replace("&lt;h3&gt;", "<h3>").replace("&lt;/h3&gt;", "</h3>")
-    safe_html = safe_html.replace("&lt;strong&gt;", "<strong>").replace("&lt;/strong&gt;", "</strong>")
-    safe_html = safe_html.replace("&lt;em&gt;", "<em>").replace("&lt;/em&gt;", "</em>")
+    # Load historical conversations from logs if history_days is specified
+    if history_days is not None and user_id:
+        historical_turns = await asyncio.to_thread(
+            conversation_logger.load_user_history_as_turns,
+            user_id=user_id,
+            days=history_days
+        )
+        # Historical turns are already sorted oldest first, so prepend them
+        history = historical_turns + history
+    return history
+
+
+def start_context_prefetch(message: str) -> asyncio.Task | None:
+    """
+    Start knowledge base retrieval for a clearly food-related message in a worker thread.
     
-    return safe_html
+    Retrieval doesn't depend on the conversation history, so it can overlap with loading
+    logged history from disk. bot.answer then finds the documents in its retrieval cache.
+    Messages without food keywords are skipped, as bot.answer may not retrieve for them.
+    Nothing is prefetched when the retrieval cache is disabled, as bot.answer would query again.
+    """
+    if settings.retrieval_cache_size <= 0 or not bot.is_food_related(message):
+        return None
+    return asyncio.create_task(asyncio.to_thread(bot.build_context, message))
 
 
-@app.on_event("startup")
-async def ensure_chroma_seeded() -> None:
-    """Load knowledge base on startup."""
-    from app.config import settings
-    import logging
+def recent_image_turn(conversation_id: str, history_merged: bool) -> bool | None:
+    """
+    Whether one of the conversation's last 2 turns was an image analysis, for bot.answer.
     
-    logger = logging.getLogger(__name__)
+    Returns None when the history also holds turns the conversation manager doesn't track
+    (client-supplied or loaded from the logs), so the chatbot scans the history itself.
+    """
+    if history_merged:
+        return None
+    return conversation_manager.has_recent_image(conversation_id)
+
+
+def cancel_task(task: asyncio.Task | None) -> None:
+    """
+    Cancel a helper task whose result is no longer needed (the request failed first), so it
+    isn't left running unobserved with a "Task exception was never retrieved" warning.
+    """
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        # Already failed: mark its exception as retrieved
+        task.exception()
+
+
+async def answer_and_record(
+    message: str,
+    history: list[dict],
+    user_id: str,
+    conversation_id: str,
+    history_merged: bool = False,
+) -> str:
+    """
+    Answer a text message with the chatbot and store the turn in the conversation.
     
+    Whether the message follows an image analysis is looked up on the conversation instead
+    of scanning the history turns, unless history_merged says the history isn't just the
+    conversation's own turns (supplied by the client or prepended from the logs).
+    """
+    answer = await run_llm_call(
+        bot.aanswer,
+        message,
+        history=history if history else None,
+        user_id=user_id,
+        conversation_id=conversation_id,
+        recent_image=recent_image_turn(conversation_id, history_merged),
+    )
+    conversation_manager.add_turn(
+        conversation_id=conversation_id,
+        user_message=message,
+        assistant_message=answer,
+        user_id=user_id,
+    )
+    return answer
+
+
+# Prefix marking image turns in the stored conversation history
+IMAGE_TURN_PREFIX = "[IMAGE] "
+
+
+async def discard_saved_image(save_task: asyncio.Task) -> None:
+    """
+    Wait for the image save of a failed turn, then delete the file if that save created it.
+    An image already stored for an earlier turn of the conversation is kept.
+    """
     try:
-        # Always load JSON data if available
-        ingest_dataset(reset=False)
-    except FileNotFoundError:
-        # JSON file is optional if MySQL is used
-        pass
-    except Exception as e:
-        # Log but don't fail startup if JSON ingestion fails
-        logger.warning(f"JSON ingestion on startup failed: {e}")
+        relative_path, _, created = await save_task
+    except (Exception, asyncio.CancelledError):
+        # Nothing was saved
+        return
+    if created:
+        await asyncio.to_thread(delete_image, relative_path)
+
+
+async def answer_image_and_record(
+    image_data: bytes,
+    original_filename: str,
+    question: str,
+    user_id: str,
+    conversation_id: str,
+    history_days: HistoryDays | None,
+) -> str:
+    """
+    Save an uploaded image, analyze it with the chatbot and store the turn in the conversation.
     
-    # Optionally load MySQL data on startup
-    if settings.ingest_mysql_on_startup:
+    Args:
+        image_data: Validated image bytes
+        original_filename: Filename used to pick the stored image's extension
+        question: Question about the image
+        user_id: User identifier
+        conversation_id: Conversation the turn belongs to
+        history_days: 3, 7 or -1 to merge logged history, or None
+    
+    Returns:
+        The chatbot's answer (Markdown)
+    """
+    # Encoding for the vision model and saving the upload are independent of the history,
+    # so run both in worker threads while the history loads; the chatbot then gets the
+    # encoded image from the cache instead of encoding it on the critical path
+    encode_task = asyncio.create_task(asyncio.to_thread(encode_image_data_url_cached, image_data))
+    save_task = asyncio.create_task(asyncio.to_thread(save_image, image_data, conversation_id, original_filename))
+    
+    try:
+        # Get conversation history, merged with logged history when history_days is specified
+        history = await build_history(conversation_id, user_id, history_days)
+        _, image_url, _ = await save_task
         try:
-            ingest_mysql(reset=False)
-        except Exception as e:
-            # Log but don't fail startup if MySQL ingestion fails
-            logger.warning(f"MySQL ingestion on startup failed: {e}")
+            await encode_task
+        except Exception:
+            # Only a warm-up; the chatbot re-encodes and reports the failure itself
+            pass
+        
+        # Analyze image with conversation history for context
+        answer = await run_llm_call(
+            bot.aanswer_with_image,
+            image_data,
+            question=question,
+            history=history if history else None,
+            user_id=user_id,
+            conversation_id=conversation_id,
+            image_url=image_url
+        )
+    except BaseException:
+        # No turn is stored: stop the warm-up and don't keep an image nothing refers to
+        cancel_task(encode_task)
+        await discard_saved_image(save_task)
+        raise
+    
+    # Store the conversation turn (image analysis now uses history for context)
+    conversation_manager.add_turn(
+        conversation_id=conversation_id,
+        user_message=IMAGE_TURN_PREFIX + question,
+        assistant_message=answer,
+        user_id=user_id,
+        is_image=True,
+    )
+    return answer
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(
-    payload: ChatRequest,
-    api_key: str = Depends(verify_api_key),
-) -> ChatResponse:
-    """Chat endpoint - requires API key authentication."""
-    if not payload.message:
-        raise HTTPException(status_code=400, detail="Message cannot be empty")
+async def answer_voice_and_record(
+    audio: UploadFile,
+    user_id: str,
+    conversation_id: str,
+    history_days: HistoryDays | None,
+) -> tuple[str, str, str]:
+    """
+    Transcribe an audio upload, answer it with the chatbot and store the turn in the conversation.
     
-    if not payload.user_id:
-        raise HTTPException(status_code=400, detail="user_id is required")
+    Args:
+        audio: Uploaded audio file
+        user_id: User identifier
+        conversation_id: Conversation the turn belongs to
+        history_days: 3, 7 or -1 to merge logged history, or None
     
-    # Generate conversation_id if not provided
-    conversation_id = payload.conversation_id or str(uuid.uuid4())
+    Returns:
+        Tuple of (transcript, answer_markdown, detected_language)
     
-    # Get conversation history (use manual history if provided for backward compatibility, otherwise use conversation manager)
-    if payload.history is not None:
-        # Backward compatibility: use provided history
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in payload.history]
-    else:
-        # Use conversation manager to get history
-        history_turns = conversation_manager.get_history(conversation_id)
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in history_turns]
+    Raises:
+        HTTPException: 500 if the voice processor can't be created, 400 for unsupported
+            formats or empty transcripts, 413 if the audio is too large
+    """
+    try:
+        voice_processor = get_voice_processor()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Voice processor initialization failed: {str(e)}")
     
-    # Load historical conversations from logs if history_days is specified
-    if payload.history_days is not None and payload.user_id:
-        from app.logger import conversation_logger
-        # Validate history_days: must be 3, 7, or -1 (all history)
-        if payload.history_days not in [3, 7, -1]:
-            raise HTTPException(
-                status_code=400, 
-                detail="history_days must be 3 (last 3 days), 7 (last 7 days), or -1 (all history)"
-            )
-        historical_turns = conversation_logger.load_user_history_as_turns(
-            user_id=payload.user_id,
-            days=payload.history_days
+    # Validate audio format
+    is_valid, audio_format = voice_processor.validate_audio_format(audio.content_type, audio.filename)
+    if not is_valid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported audio format. Supported formats: WebM, MP3, WAV, M4A, OGG"
         )
-        # Merge historical turns with current conversation history
-        # Historical turns are already sorted oldest first, so prepend them
-        history = historical_turns + history
     
+    # Read audio data (bounded by MAX_AUDIO_BYTES)
+    audio_data = await read_upload_limited(audio, MAX_AUDIO_BYTES, label="Audio file")
+    
+    # Convert speech to text
+    transcript, detected_language = await asyncio.to_thread(voice_processor.speech_to_text, audio_data, audio_format)
+    
+    if not transcript or not transcript.strip():
+        raise HTTPException(status_code=400, detail="Could not transcribe audio. Please ensure audio contains clear speech.")
+    
+    prefetch = start_context_prefetch(transcript)
+    
+    # Get conversation history, merged with logged history when history_days is specified
     try:
-        answer = bot.answer(
-            payload.message, 
-            history=history if history else None, 
-            user_id=payload.user_id,
-            conversation_id=conversation_id
-        )
-        
-        # Store the conversation turn
-        conversation_manager.add_turn(
-            conversation_id=conversation_id,
-            user_message=payload.message,
-            assistant_message=answer,
-            user_id=payload.user_id,
+        history = await build_history(conversation_id, user_id, history_days)
+    except BaseException:
+        cancel_task(prefetch)
+        raise
+    if prefetch is not None:
+        await prefetch
+    
+    # Process through chatbot
+    answer_markdown = await answer_and_record(
+        transcript, history, user_id, conversation_id, history_merged=history_days is not None
+    )
+    return transcript, answer_markdown, detected_language
+
+
+def json_model_response(model: BaseModel) -> Response:
+    """
+    Serialize a response model straight to JSON bytes.
+    
+    Returning a Response skips FastAPI's response_model re-validation and
+    jsonable_encoder pass; the route's response_model still documents the schema.
+    """
+    return Response(content=to_json(model), media_type="application/json")
+
+
+def require_ready(request: Request) -> None:
+    """
+    Dependency that rejects chat requests until startup ingestion has finished.
+    
+    Raises:
+        HTTPException: 503 if the knowledge base is still loading
+    """
+    if not getattr(request.app.state, "ready", True):
+        raise HTTPException(
+            status_code=503,
+            detail="Service is starting up. Please retry shortly.",
+            headers={"Retry-After": "5"},
         )
-    except TimeoutError as exc:
-        raise HTTPException(status_code=504, detail=f"Request timeout: {str(exc)}") from exc
-    except Exception as exc:  # pragma: no cover - propagate LLM errors with context
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+
+async def parse_chat_request(request: Request) -> ChatRequest:
+    """
+    Dependency that validates the raw JSON body straight into a ChatRequest.
+    
+    model_validate_json parses and validates in one pydantic-core pass, skipping
+    the intermediate dict FastAPI builds with json.loads for a ChatRequest parameter.
     
-    return ChatResponse(answer=answer, conversation_id=conversation_id)
+    Raises:
+        RequestValidationError: 422 with the same error format as FastAPI's body validation
+    """
+    try:
+        return ChatRequest.model_validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in exc.errors(include_url=False)]
+        ) from exc
 
 
-@app.post(
-    "/chat/html",
-    response_model=HTMLChatResponse,
-    responses={200: {"content": {"application/json": {}}}},
-)
-async def chat_html_endpoint(
-    payload: ChatRequest,
-    api_key: str = Depends(verify_api_key),
-) -> HTMLChatResponse:
+def _inline_schema_refs(schema: dict) -> dict:
+    """Resolve a JSON schema's local "$defs" references in place, for embedding it in an operation."""
+    definitions = schema.pop("$defs", {})
+    
+    def resolve(node):
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if ref and ref.startswith("#/$defs/"):
+                return resolve(dict(definitions[ref[len("#/$defs/"):]]))
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+    
+    return resolve(schema)
+
+
+# The body is read by parse_chat_request, so document it on the routes explicitly
+CHAT_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _inline_schema_refs(ChatRequest.model_json_schema())}},
+    }
+}
+
+
+async def prepare_chat_request(payload: ChatRequest) -> tuple[str, list[dict]]:
     """
-    Chat endpoint that returns HTML instead of JSON.
-    Converts Markdown headers (#, ##, ###) and formatting (*, **) to HTML.
+    Validate a text chat request and gather what answering it needs.
+    
+    Returns:
+        Tuple of (conversation_id, history)
+    
+    Raises:
+        HTTPException: 400 for an empty message or missing user_id
     """
     if not payload.message:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
@@ -287,60 +873,189 @@ async def chat_html_endpoint(
         raise HTTPException(status_code=400, detail="user_id is required")
     
     # Generate conversation_id if not provided
-    conversation_id = payload.conversation_id or str(uuid.uuid4())
+    conversation_id = payload.conversation_id or new_conversation_id()
     
-    # Get conversation history (use manual history if provided for backward compatibility, otherwise use conversation manager)
-    if payload.history is not None:
-        # Backward compatibility: use provided history
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in payload.history]
-    else:
-        # Use conversation manager to get history
-        history_turns = conversation_manager.get_history(conversation_id)
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in history_turns]
+    prefetch = start_context_prefetch(payload.message)
     
-    # Load historical conversations from logs if history_days is specified
-    if payload.history_days is not None and payload.user_id:
-        from app.logger import conversation_logger
-        # Validate history_days: must be 3, 7, or -1 (all history)
-        if payload.history_days not in [3, 7, -1]:
-            raise HTTPException(
-                status_code=400, 
-                detail="history_days must be 3 (last 3 days), 7 (last 7 days), or -1 (all history)"
-            )
-        historical_turns = conversation_logger.load_user_history_as_turns(
-            user_id=payload.user_id,
-            days=payload.history_days
+    # Get conversation history (manual history override for backward compatibility, otherwise
+    # conversation manager), merged with logged history when history_days is specified
+    try:
+        history = await build_history(
+            conversation_id,
+            payload.user_id,
+            payload.history_days,
+            override=payload.history,
         )
-        # Merge historical turns with current conversation history
-        # Historical turns are already sorted oldest first, so prepend them
-        history = historical_turns + history
+    except BaseException:
+        cancel_task(prefetch)
+        raise
+    if prefetch is not None:
+        await prefetch
+    return conversation_id, history
+
+
+async def answer_chat_request(payload: ChatRequest) -> tuple[str, str]:
+    """
+    Validate a text chat request, answer it and store the turn in the conversation.
+    
+    Returns:
+        Tuple of (answer_markdown, conversation_id)
+    
+    Raises:
+        HTTPException: 400 for an empty message or missing user_id, 504 on LLM timeout, 500 on other errors
+    """
+    conversation_id, history = await prepare_chat_request(payload)
     
     try:
-        answer = bot.answer(
-            payload.message, 
-            history=history if history else None, 
-            user_id=payload.user_id,
-            conversation_id=conversation_id
-        )
-        
-        # Store the conversation turn
-        conversation_manager.add_turn(
-            conversation_id=conversation_id,
-            user_message=payload.message,
-            assistant_message=answer,
-            user_id=payload.user_id,
+        answer = await answer_and_record(
+            payload.message,
+            history,
+            payload.user_id,
+            conversation_id,
+            history_merged=payload.history is not None or payload.history_days is not None,
         )
     except TimeoutError as exc:
         raise HTTPException(status_code=504, detail=f"Request timeout: {str(exc)}") from exc
     except Exception as exc:  # pragma: no cover - propagate LLM errors with context
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+    return answer, conversation_id
+
+
+@app.get("/readyz")
+async def readiness_endpoint(_ready: None = Depends(require_ready)) -> dict:
+    """Readiness probe - returns 503 until startup ingestion has finished."""
+    return {"status": "ready"}
 
+
+@app.get("/stats/retrieval-cache")
+async def retrieval_cache_stats_endpoint(api_key: str = Depends(verify_api_key)) -> dict:
+    """Knowledge base retrieval cache counters for this worker - requires API key authentication."""
+    return bot.retrieval_cache_info()
+
+
+@app.post("/chat", response_model=ChatResponse, openapi_extra=CHAT_REQUEST_OPENAPI)
+async def chat_endpoint(
+    payload: ChatRequest = Depends(parse_chat_request),
+    api_key: str = Depends(verify_api_key),
+    _ready: None = Depends(require_ready),
+) -> ChatResponse:
+    """Chat endpoint - requires API key authentication."""
+    answer, conversation_id = await answer_chat_request(payload)
+    return ChatResponse.model_construct(answer=answer, conversation_id=conversation_id)
+
+
+@app.post(
+    "/chat/html",
+    response_model=HTMLChatResponse,
+    responses={200: {"content": {"application/json": {}}}},
+    openapi_extra=CHAT_REQUEST_OPENAPI,
+)
+async def chat_html_endpoint(
+    payload: ChatRequest = Depends(parse_chat_request),
+    api_key: str = Depends(verify_api_key),
+    _ready: None = Depends(require_ready),
+) -> Response:
+    """
+    Chat endpoint that returns HTML instead of JSON.
+    Converts Markdown headers (#, ##, ###) and formatting (*, **) to HTML.
+    """
+    answer, conversation_id = await answer_chat_request(payload)
     safe_html = markdown_to_html(answer)
-    return HTMLChatResponse(
+    return json_model_response(HTMLChatResponse.model_construct(
         status=200,
         message="ok",
         conversation_id=conversation_id,
         data=safe_html
+    ))
+
+
+@app.post(
+    "/chat/html/raw",
+    response_class=HTMLResponse,
+    responses={200: {"headers": {"X-Conversation-Id": {"description": "Conversation ID for this conversation", "schema": {"type": "string"}}}}},
+    openapi_extra=CHAT_REQUEST_OPENAPI,
+)
+async def chat_html_raw_endpoint(
+    payload: ChatRequest = Depends(parse_chat_request),
+    api_key: str = Depends(verify_api_key),
+    _ready: None = Depends(require_ready),
+) -> HTMLResponse:
+    """
+    Chat endpoint that returns the HTML answer as the raw response body (text/html).
+    Same as /chat/html without the JSON envelope; the conversation ID is sent
+    in the X-Conversation-Id response header.
+    """
+    answer, conversation_id = await answer_chat_request(payload)
+    return HTMLResponse(content=markdown_to_html(answer), headers={"X-Conversation-Id": conversation_id})
+
+
+def sse_event(data: str, event: str | None = None) -> str:
+    """Format one server-sent event; multi-line data becomes several data: lines."""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_and_record(payload: ChatRequest, conversation_id: str, history: list[dict]):
+    """
+    Stream the chatbot's answer as server-sent events and store the turn once it is complete.
+    
+    Each piece of the Markdown answer is sent as a data event as soon as the LLM produces it,
+    followed by an "end" event. If answering fails midway, an "error" event is sent instead
+    and the turn is not stored.
+    """
+    async with _llm_semaphore:
+        pieces = bot.answer_stream(
+            payload.message,
+            history=history if history else None,
+            user_id=payload.user_id,
+            conversation_id=conversation_id,
+            recent_image=recent_image_turn(
+                conversation_id, payload.history is not None or payload.history_days is not None
+            ),
+        )
+        parts: list[str] = []
+        try:
+            async for piece in iterate_in_threadpool(pieces):
+                parts.append(piece)
+                yield sse_event(piece)
+        except Exception as exc:
+            logger.warning("Streaming chat answer failed: %s", exc)
+            yield sse_event(str(exc), event="error")
+            return
+    conversation_manager.add_turn(
+        conversation_id=conversation_id,
+        user_message=payload.message,
+        assistant_message="".join(parts).strip(),
+        user_id=payload.user_id,
+    )
+    yield sse_event(conversation_id, event="end")
+
+
+@app.post(
+    "/chat/stream",
+    response_class=StreamingResponse,
+    responses={200: {
+        "content": {"text/event-stream": {}},
+        "headers": {"X-Conversation-Id": {"description": "Conversation ID for this conversation", "schema": {"type": "string"}}},
+    }},
+    openapi_extra=CHAT_REQUEST_OPENAPI,
+)
+async def chat_stream_endpoint(
+    payload: ChatRequest = Depends(parse_chat_request),
+    api_key: str = Depends(verify_api_key),
+    _ready: None = Depends(require_ready),
+) -> StreamingResponse:
+    """
+    Chat endpoint that streams the Markdown answer as server-sent events while it is generated.
+    Pieces arrive as data events, then an "end" event carrying the conversation ID (also sent
+    in the X-Conversation-Id header); a failure midway ends the stream with an "error" event.
+    """
+    conversation_id, history = await prepare_chat_request(payload)
+    return StreamingResponse(
+        stream_and_record(payload, conversation_id, history),
+        media_type="text/event-stream",
+        headers={"X-Conversation-Id": conversation_id, "Cache-Control": "no-cache"},
     )
 
 
@@ -350,8 +1065,9 @@ async def chat_image_endpoint(
     question: str = Query("What is in this image? Estimate the calories.", description="Question about the image"),
     conversation_id: str | None = Form(None, description="Conversation ID for maintaining context"),
     user_id: str = Form(..., description="User identifier (required)"),
-    history_days: int | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
+    history_days: HistoryDays | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
     api_key: str = Depends(verify_api_key),
+    _ready: None = Depends(require_ready),
 ) -> ChatResponse:
     """Analyze a food image and answer questions about it - requires API key authentication."""
     # Validate file type
@@ -363,55 +1079,21 @@ async def chat_image_endpoint(
         raise HTTPException(status_code=400, detail="user_id is required")
     
     # Generate conversation_id if not provided
-    conversation_id = conversation_id or str(uuid.uuid4())
+    conversation_id = conversation_id or new_conversation_id()
     
     try:
-        # Read image data
-        image_data = await image.read()
+        # Read image data (signature-checked and bounded by MAX_IMAGE_BYTES)
+        image_data = await read_image_upload(image)
         
-        # Save image to filesystem and get URL
         original_filename = image.filename or "image.jpg"
-        _, image_url = save_image(image_data, conversation_id, original_filename)
-        
-        # Get conversation history (similar to text chat endpoint)
-        history_turns = conversation_manager.get_history(conversation_id)
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in history_turns]
-        
-        # Load historical conversations from logs if history_days is specified
-        if history_days is not None:
-            from app.logger import conversation_logger
-            # Validate history_days: must be 3, 7, or -1 (all history)
-            if history_days not in [3, 7, -1]:
-                raise HTTPException(
-                    status_code=400,
-                    detail="history_days must be 3 (last 3 days), 7 (last 7 days), or -1 (all history)"
-                )
-            historical_turns = conversation_logger.load_user_history_as_turns(
-                user_id=user_id,
-                days=history_days
-            )
-            # Merge historical turns with current conversation history
-            history = historical_turns + history
-        
-        # Analyze image with conversation history for context
-        answer = bot.answer_with_image(
-            image_data, 
-            question=question,
-            history=history if history else None,
-            user_id=user_id,
-            conversation_id=conversation_id,
-            image_url=image_url
-        )
         
-        # Store the conversation turn (image analysis now uses history for context)
-        conversation_manager.add_turn(
-            conversation_id=conversation_id,
-            user_message=f"[IMAGE] {question}",
-            assistant_message=answer,
-            user_id=user_id,
+        answer = await answer_image_and_record(
+            image_data, original_filename, question, user_id, conversation_id, history_days
         )
         
-        return ChatResponse(answer=answer, conversation_id=conversation_id)
+        return ChatResponse.model_construct(answer=answer, conversation_id=conversation_id)
+    except HTTPException:
+        raise
     except TimeoutError as exc:
         raise HTTPException(status_code=504, detail=f"Image analysis timeout: {str(exc)}") from exc
     except Exception as exc:
@@ -429,9 +1111,10 @@ async def chat_image_html_endpoint(
     question: str = Query("What is in this image? Estimate the calories.", description="Question about the image"),
     conversation_id: str | None = Form(None, description="Conversation ID for maintaining context"),
     user_id: str = Form(..., description="User identifier (required)"),
-    history_days: int | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
+    history_days: HistoryDays | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
     api_key: str = Depends(verify_api_key),
-) -> HTMLChatResponse:
+    _ready: None = Depends(require_ready),
+) -> Response:
     """
     Analyze a food image and return HTML response.
     Converts Markdown headers (#, ##, ###) and formatting (*, **) to HTML.
@@ -449,7 +1132,7 @@ async def chat_image_html_endpoint(
         raise HTTPException(status_code=400, detail="user_id is required")
     
     # Generate conversation_id if not provided
-    conversation_id = conversation_id or str(uuid.uuid4())
+    conversation_id = conversation_id or new_conversation_id()
     
     try:
         # Handle image data - either from file upload or base64
@@ -458,8 +1141,8 @@ async def chat_image_html_endpoint(
             # Validate file type
             if not image.content_type or not image.content_type.startswith("image/"):
                 raise HTTPException(status_code=400, detail="File must be an image")
-            # Read image data from file upload
-            image_data = await image.read()
+            # Read image data from file upload (signature-checked and bounded by MAX_IMAGE_BYTES)
+            image_data = await read_image_upload(image)
             original_filename = image.filename or "image.jpg"
         else:
             # Handle base64 encoded image
@@ -473,56 +1156,28 @@ async def chat_image_html_endpoint(
                 original_filename = "image.jpg"
             except Exception as e:
                 raise HTTPException(status_code=400, detail=f"Invalid base64 image data: {str(e)}")
-        
-        # Save image to filesystem and get URL
-        _, image_url = save_image(image_data, conversation_id, original_filename)
-        
-        # Get conversation history (similar to text chat endpoint)
-        history_turns = conversation_manager.get_history(conversation_id)
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in history_turns]
-        
-        # Load historical conversations from logs if history_days is specified
-        if history_days is not None:
-            from app.logger import conversation_logger
-            # Validate history_days: must be 3, 7, or -1 (all history)
-            if history_days not in [3, 7, -1]:
+            if len(image_data) > MAX_IMAGE_BYTES:
                 raise HTTPException(
-                    status_code=400,
-                    detail="history_days must be 3 (last 3 days), 7 (last 7 days), or -1 (all history)"
+                    status_code=413,
+                    detail=f"Image too large. Maximum size: {settings.max_image_size_mb}MB",
                 )
-            historical_turns = conversation_logger.load_user_history_as_turns(
-                user_id=user_id,
-                days=history_days
-            )
-            # Merge historical turns with current conversation history
-            history = historical_turns + history
+            if not has_image_signature(image_data[:IMAGE_SIGNATURE_LENGTH]):
+                raise HTTPException(status_code=415, detail="Unsupported image format. Supported formats: JPEG, PNG, GIF, WEBP")
         
-        # Analyze image with conversation history for context
-        answer = bot.answer_with_image(
-            image_data, 
-            question=question,
-            history=history if history else None,
-            user_id=user_id,
-            conversation_id=conversation_id,
-            image_url=image_url
-        )
-        
-        # Store the conversation turn (image analysis now uses history for context)
-        conversation_manager.add_turn(
-            conversation_id=conversation_id,
-            user_message=f"[IMAGE] {question}",
-            assistant_message=answer,
-            user_id=user_id,
+        answer = await answer_image_and_record(
+            image_data, original_filename, question, user_id, conversation_id, history_days
         )
         
         # Convert Markdown to HTML
         safe_html = markdown_to_html(answer)
-        return HTMLChatResponse(
+        return json_model_response(HTMLChatResponse.model_construct(
             status=200,
             message="ok",
             conversation_id=conversation_id,
             data=safe_html
-        )
+        ))
+    except HTTPException:
+        raise
     except TimeoutError as exc:
         raise HTTPException(status_code=504, detail=f"Image analysis timeout: {str(exc)}") from exc
     except Exception as exc:
@@ -535,10 +1190,18 @@ async def reingest(
     api_key: str = Depends(verify_api_key),
 ) -> dict:
     """Reingest the knowledge base from JSON file - requires API key authentication (admin endpoint)."""
-    count = ingest_dataset(reset=reset)
+    count = await asyncio.to_thread(ingest_dataset, reset=reset)
+    # Cached answers may be based on the old knowledge base
+    response_cache.clear()
     return {"documents": count, "reset": reset, "source": "json"}
 
 
+@lru_cache(maxsize=64)
+def _parse_tables(spec: str) -> tuple[str, ...]:
+    """Parse a comma-separated table list, dropping blank entries (e.g. "a, ,b," -> ("a", "b"))."""
+    return tuple(name for name in (part.strip() for part in spec.split(",")) if name)
+
+
 @app.post("/ingest/mysql")
 async def reingest_mysql(
     reset: bool = False,
@@ -552,8 +1215,11 @@ async def reingest_mysql(
         reset: If True, reset the vector store before adding MySQL data
         tables: Comma-separated list of table names to ingest. If None, ingests all tables.
     """
-    table_list = [t.strip() for t in tables.split(",")] if tables else None
-    count = ingest_mysql(reset=reset, table_names=table_list)
+    # An empty spec (or one of only commas/whitespace) means "all tables"
+    table_list = list(_parse_tables(tables)) or None if tables else None
+    count = await asyncio.to_thread(ingest_mysql, reset=reset, table_names=table_list)
+    # Cached answers may be based on the old knowledge base
+    response_cache.clear()
     return {
         "documents": count,
         "reset": reset,
@@ -567,109 +1233,47 @@ async def chat_voice_endpoint(
     audio: UploadFile = File(..., description="Audio file (WebM or MP3) containing user's voice message"),
     conversation_id: str | None = Form(None, description="Conversation ID for maintaining context"),
     user_id: str = Form(..., description="User identifier (required)"),
-    history_days: int | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
+    history_days: HistoryDays | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
     api_key: str = Depends(verify_api_key),
+    _ready: None = Depends(require_ready),
 ) -> VoiceChatResponse:
     """
     Voice chat endpoint - accepts audio input and returns audio response.
     Supports Arabic and English - responds in the same language as input.
     """
-    from app.logger import conversation_logger
-    
     # Validate user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     
     # Generate conversation_id if not provided
-    conversation_id = conversation_id or str(uuid.uuid4())
+    conversation_id = conversation_id or new_conversation_id()
     
-    # Validate audio format
     try:
-        voice_processor = get_voice_processor()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Voice processor initialization failed: {str(e)}")
-    
-    is_valid, audio_format = voice_processor.validate_audio_format(audio.content_type, audio.filename)
-    
-    if not is_valid:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported audio format. Supported formats: WebM, MP3, WAV, M4A, OGG"
-        )
-    
-    try:
-        # Read audio data
-        audio_data = await audio.read()
-        
-        # Validate audio size
-        if not voice_processor.validate_audio_size(audio_data, max_size_mb=settings.max_audio_size_mb):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Audio file too large. Maximum size: {settings.max_audio_size_mb}MB"
-            )
-        
-        # Convert speech to text
-        transcript, detected_language = voice_processor.speech_to_text(audio_data, audio_format)
-        
-        if not transcript or not transcript.strip():
-            raise HTTPException(status_code=400, detail="Could not transcribe audio. Please ensure audio contains clear speech.")
-        
-        # Get conversation history (similar to text endpoints)
-        history_turns = conversation_manager.get_history(conversation_id)
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in history_turns]
-        
-        # Load historical conversations from logs if history_days is specified
-        if history_days is not None:
-            # Validate history_days: must be 3, 7, or -1 (all history)
-            if history_days not in [3, 7, -1]:
-                raise HTTPException(
-                    status_code=400,
-                    detail="history_days must be 3 (last 3 days), 7 (last 7 days), or -1 (all history)"
-                )
-            historical_turns = conversation_logger.load_user_history_as_turns(
-                user_id=user_id,
-                days=history_days
-            )
-            # Merge historical turns with current conversation history
-            history = historical_turns + history
-        
-        # Process through chatbot
-        answer_markdown = bot.answer(
-            transcript,
-            history=history if history else None,
-            user_id=user_id,
-            conversation_id=conversation_id
+        transcript, answer_markdown, detected_language = await answer_voice_and_record(
+            audio, user_id, conversation_id, history_days
         )
         
         # Convert Markdown to HTML for data field
         answer_text_html = markdown_to_html(answer_markdown)
         
-        # Store the conversation turn (store original markdown for consistency)
-        conversation_manager.add_turn(
-            conversation_id=conversation_id,
-            user_message=transcript,
-            assistant_message=answer_markdown,
-            user_id=user_id,
-        )
-        
         # Convert text response to speech (use original markdown, not HTML)
         # Use detected language to ensure voice matches
         audio_base64 = None
         try:
-            audio_response = voice_processor.text_to_speech(
+            audio_response = await asyncio.to_thread(
+                get_voice_processor().text_to_speech,
                 text=answer_markdown,
                 language=detected_language,
                 voice=settings.tts_voice,
                 model=settings.tts_model,
             )
-            audio_base64 = base64.b64encode(audio_response).decode("utf-8")
+            audio_base64 = b64encode_to_str(audio_response)
         except Exception as tts_error:
             # If TTS fails, still return the text response
             # Log the error but don't fail the request
-            import logging
-            logging.warning(f"TTS conversion failed: {tts_error}")
+            logger.warning(f"TTS conversion failed: {tts_error}")
         
-        return VoiceChatResponse(
+        return VoiceChatResponse.model_construct(
             status=200,
             message="ok",
             transcript=transcript,
@@ -687,97 +1291,106 @@ async def chat_voice_endpoint(
         raise HTTPException(status_code=500, detail=f"Voice processing error: {str(exc)}") from exc
 
 
-@app.post("/chat/voice/text", response_model=VoiceChatResponse)
-async def chat_voice_text_endpoint(
+@app.post(
+    "/chat/voice/audio",
+    response_class=Response,
+    responses={200: {
+        "content": {"audio/mpeg": {}},
+        "headers": {
+            "X-Conversation-Id": {"description": "Conversation ID for this conversation", "schema": {"type": "string"}},
+            "X-Transcript": {"description": "URL-encoded transcript of the user's audio", "schema": {"type": "string"}},
+            "X-Detected-Language": {"description": "Detected language code (ar or en)", "schema": {"type": "string"}},
+        },
+    }},
+)
+async def chat_voice_audio_endpoint(
     audio: UploadFile = File(..., description="Audio file (WebM or MP3) containing user's voice message"),
     conversation_id: str | None = Form(None, description="Conversation ID for maintaining context"),
     user_id: str = Form(..., description="User identifier (required)"),
-    history_days: int | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
+    history_days: HistoryDays | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
     api_key: str = Depends(verify_api_key),
-) -> VoiceChatResponse:
+    _ready: None = Depends(require_ready),
+) -> Response:
     """
-    Voice chat endpoint that returns text response instead of audio (for debugging/preview).
-    Accepts audio input, processes it, but returns JSON with text response only.
+    Voice chat endpoint that returns the spoken answer as raw MP3 bytes (audio/mpeg).
+    Same as /chat/voice without base64-encoding the audio into JSON; the transcript,
+    conversation ID and detected language are sent in response headers.
     """
-    from app.logger import conversation_logger
-    
     # Validate user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     
     # Generate conversation_id if not provided
-    conversation_id = conversation_id or str(uuid.uuid4())
+    conversation_id = conversation_id or new_conversation_id()
     
-    # Validate audio format
     try:
-        voice_processor = get_voice_processor()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Voice processor initialization failed: {str(e)}")
-    
-    is_valid, audio_format = voice_processor.validate_audio_format(audio.content_type, audio.filename)
-    
-    if not is_valid:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported audio format. Supported formats: WebM, MP3, WAV, M4A, OGG"
+        transcript, answer_markdown, detected_language = await answer_voice_and_record(
+            audio, user_id, conversation_id, history_days
         )
-    
-    try:
-        # Read audio data
-        audio_data = await audio.read()
         
-        # Validate audio size
-        if not voice_processor.validate_audio_size(audio_data, max_size_mb=settings.max_audio_size_mb):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Audio file too large. Maximum size: {settings.max_audio_size_mb}MB"
+        # Audio is the whole response here, so a TTS failure fails the request
+        try:
+            audio_response = await asyncio.to_thread(
+                get_voice_processor().text_to_speech,
+                text=answer_markdown,
+                language=detected_language,
+                voice=settings.tts_voice,
+                model=settings.tts_model,
             )
+        except TimeoutError:
+            raise
+        except Exception as tts_error:
+            raise HTTPException(status_code=502, detail=f"Text-to-speech failed: {str(tts_error)}") from tts_error
         
-        # Convert speech to text
-        transcript, detected_language = voice_processor.speech_to_text(audio_data, audio_format)
-        
-        if not transcript or not transcript.strip():
-            raise HTTPException(status_code=400, detail="Could not transcribe audio. Please ensure audio contains clear speech.")
-        
-        # Get conversation history
-        history_turns = conversation_manager.get_history(conversation_id)
-        history = [{"user": turn.user, "assistant": turn.assistant} for turn in history_turns]
-        
-        # Load historical conversations from logs if history_days is specified
-        if history_days is not None:
-            if history_days not in [3, 7, -1]:
-                raise HTTPException(
-                    status_code=400,
-                    detail="history_days must be 3 (last 3 days), 7 (last 7 days), or -1 (all history)"
-                )
-            historical_turns = conversation_logger.load_user_history_as_turns(
-                user_id=user_id,
-                days=history_days
-            )
-            history = historical_turns + history
+        return Response(
+            content=audio_response,
+            media_type="audio/mpeg",
+            headers={
+                "X-Conversation-Id": conversation_id,
+                # Headers must be latin-1; the transcript may be Arabic
+                "X-Transcript": quote(transcript),
+                "X-Detected-Language": detected_language or "",
+            },
+        )
         
-        # Process through chatbot
-        # The bot.answer() method already logs the conversation, so we don't need to log again
-        answer_markdown = bot.answer(
-            transcript,
-            history=history if history else None,
-            user_id=user_id,
-            conversation_id=conversation_id
+    except HTTPException:
+        raise
+    except TimeoutError as exc:
+        raise HTTPException(status_code=504, detail=f"Voice processing timeout: {str(exc)}") from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Voice processing error: {str(exc)}") from exc
+
+
+@app.post("/chat/voice/text", response_model=VoiceChatResponse)
+async def chat_voice_text_endpoint(
+    audio: UploadFile = File(..., description="Audio file (WebM or MP3) containing user's voice message"),
+    conversation_id: str | None = Form(None, description="Conversation ID for maintaining context"),
+    user_id: str = Form(..., description="User identifier (required)"),
+    history_days: HistoryDays | None = Form(None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history)"),
+    api_key: str = Depends(verify_api_key),
+    _ready: None = Depends(require_ready),
+) -> VoiceChatResponse:
+    """
+    Voice chat endpoint that returns text response instead of audio (for debugging/preview).
+    Accepts audio input, processes it, but returns JSON with text response only.
+    """
+    # Validate user_id
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id is required")
+    
+    # Generate conversation_id if not provided
+    conversation_id = conversation_id or new_conversation_id()
+    
+    try:
+        transcript, answer_markdown, detected_language = await answer_voice_and_record(
+            audio, user_id, conversation_id, history_days
         )
         
         # Convert Markdown to HTML for data field
         answer_text_html = markdown_to_html(answer_markdown)
         
-        # Store the conversation turn (store original markdown for consistency)
-        conversation_manager.add_turn(
-            conversation_id=conversation_id,
-            user_message=transcript,
-            assistant_message=answer_markdown,
-            user_id=user_id,
-        )
-        
         # Return text response only (no audio)
-        return VoiceChatResponse(
+        return VoiceChatResponse.model_construct(
             status=200,
             message="ok",
             transcript=transcript,
@@ -795,48 +1408,54 @@ async def chat_voice_text_endpoint(
         raise HTTPException(status_code=500, detail=f"Voice processing error: {str(exc)}") from exc
 
 
-@app.get("/conversations", response_model=ConversationListResponse)
+@app.get(
+    "/conversations",
+    response_model=ConversationListResponse,
+    responses={200: {"content": {"application/json": {}}}},
+)
 async def list_conversations_endpoint(
     user_id: str,
     api_key: str = Depends(verify_api_key),
-) -> ConversationListResponse:
+) -> Response:
     """
     List all conversations for a user.
     Returns conversation summaries sorted by last_updated (most recent first).
     Maximum 100 conversations returned.
     """
-    from app.logger import conversation_logger
-    
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     
     try:
-        conversations_dict = conversation_logger.list_user_conversations(user_id=user_id, max_conversations=100)
+        conversations_dict = await asyncio.to_thread(
+            conversation_logger.list_user_conversations, user_id=user_id, max_conversations=100
+        )
         
         # Convert dicts to ConversationSummary models
-        conversations = [ConversationSummary(**conv) for conv in conversations_dict]
+        conversations = [ConversationSummary.model_construct(**conv) for conv in conversations_dict]
         
-        return ConversationListResponse(
+        return json_model_response(ConversationListResponse.model_construct(
             conversations=conversations,
             total=len(conversations),
-        )
+        ))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Error listing conversations: {str(exc)}") from exc
 
 
-@app.get("/conversations/{conversation_id}", response_model=ConversationDetailResponse)
+@app.get(
+    "/conversations/{conversation_id}",
+    response_model=ConversationDetailResponse,
+    responses={200: {"content": {"application/json": {}}}},
+)
 async def get_conversation_endpoint(
     conversation_id: str,
     user_id: str,
     api_key: str = Depends(verify_api_key),
-) -> ConversationDetailResponse:
+) -> Response:
     """
     Get full conversation history for a specific conversation.
     Security: Only returns conversations that match both conversation_id AND user_id.
     Returns 404 if conversation not found or user_id doesn't match.
     """
-    from app.logger import conversation_logger
-    
     if not conversation_id:
         raise HTTPException(status_code=400, detail="conversation_id is required")
     
@@ -844,7 +1463,8 @@ async def get_conversation_endpoint(
         raise HTTPException(status_code=400, detail="user_id is required")
     
     try:
-        messages = conversation_logger.get_conversation_history(
+        messages = await asyncio.to_thread(
+            conversation_logger.get_conversation_history,
             conversation_id=conversation_id,
             user_id=user_id,
         )
@@ -861,16 +1481,16 @@ async def get_conversation_endpoint(
         message_count = len(messages)
         
         # Convert dicts to ConversationMessage models
-        message_models = [ConversationMessage(**msg) for msg in messages]
+        message_models = [ConversationMessage.model_construct(**msg) for msg in messages]
         
-        return ConversationDetailResponse(
+        return json_model_response(ConversationDetailResponse.model_construct(
             conversation_id=conversation_id,
             user_id=user_id,
             messages=message_models,
             created_at=created_at,
             last_updated=last_updated,
             message_count=message_count,
-        )
+        ))
     except HTTPException:
         raise
     except Exception as exc:
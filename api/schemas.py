@@ -1,11 +1,25 @@
 from __future__ import annotations
 
+from enum import IntEnum
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from typing_extensions import TypedDict
 
 
-class ChatTurn(BaseModel):
+class HistoryDays(IntEnum):
+    """
+    How much logged history to merge into a conversation.
+    Form fields arrive as strings, which pydantic coerces ("3" -> HistoryDays.LAST_3_DAYS).
+    """
+    LAST_3_DAYS = 3
+    LAST_7_DAYS = 7
+    ALL = -1
+
+
+# A TypedDict rather than a model: turns validate straight into plain dicts, the format the
+# chatbot consumes, without building a model instance per turn
+class ChatTurn(TypedDict):
     user: str
     assistant: str
 
@@ -14,11 +28,14 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="User question or command")
     conversation_id: Optional[str] = Field(default=None, description="Conversation ID for maintaining context. If not provided, a new conversation is started.")
     history: Optional[List[ChatTurn]] = Field(default=None, description="DEPRECATED: Use conversation_id instead. Manual history override (for backward compatibility).")
-    history_days: Optional[int] = Field(default=None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history). Merged with current conversation context.")
+    history_days: Optional[HistoryDays] = Field(default=None, description="Load user's conversation history: 3 (last 3 days), 7 (last 7 days), or -1 (all history). Merged with current conversation context.")
     user_id: str = Field(..., description="User identifier (required for conversation history)")
 
 
 class ImageChatRequest(BaseModel):
+    # Not used by any endpoint (images arrive as multipart form fields); build the validator only if needed
+    model_config = ConfigDict(defer_build=True)
+    
     question: str = Field(
         default="What is in this image? Estimate the calories.",
         description="Question about the uploaded image",
@@ -1,21 +1,149 @@
 from __future__ import annotations
 
+import asyncio
 import re
-from typing import List, Sequence
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Sequence, Tuple
 
 from app.config import settings
+from app.conversation_manager import turn_fields
 # Note: is_food_image is kept for backward compatibility but validation is now combined with analysis
 # from app.image_validator import is_food_image
-from app.image_utils import encode_image_to_base64
+from app.image_utils import encode_image_data_url_cached, encode_image_to_data_url
 from app.llm import llm_client
 from app.logger import conversation_logger
-from app.prompts import CALORIE_FOCUS_PROMPT, CHAT_PROMPT_TEMPLATE, IMAGE_ANALYSIS_PROMPT, SYSTEM_PROMPT
+from app.prompts import (
+    CALORIE_FOCUS_PROMPT,
+    CHAT_INSTRUCTIONS,
+    CHAT_USER_TEMPLATE,
+    GREETING_REPLY_AR,
+    GREETING_REPLY_EN,
+    IMAGE_ANALYSIS_PROMPT,
+    INTRO_REPLY_AR,
+    INTRO_REPLY_EN,
+    SYSTEM_PROMPT,
+    THANKS_REPLY_AR,
+    THANKS_REPLY_EN,
+)
+from app.response_cache import response_cache
 from app.vector_store import Document, vector_store
 
+# Try to import hyperscan for SIMD-accelerated keyword scanning
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+    hyperscan = None
+
+
+def _keyword_trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Build a regex matching any of the keywords, with shared prefixes factored out.
+    
+    ("cook", "cookie", "calorie") -> "c(?:alorie|ook(?:ie)?)"
+    The regex engine then makes one pass over the text instead of one per keyword.
+    """
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A keyword ends here and longer ones continue: the rest is optional
+        return f"(?:{pattern})?" if "" in node else pattern
+    
+    return build(trie)
+
+
+# CHAT_USER_TEMPLATE split around its placeholders once, so each request only joins strings
+_USER_PROMPT_HEAD, _USER_PROMPT_MIDDLE, _USER_PROMPT_TAIL = re.split(r"\{context\}|\{question\}", CHAT_USER_TEMPLATE)
+_CONTEXT_FOUND_NOTE = "\n\nCRITICAL: You have RetrievedContext above. You MUST prioritize and use information from the RetrievedContext as your primary source. Only use general knowledge if the context doesn't fully answer the question."
+_NO_CONTEXT_NOTE = "\n\nNOTE: No relevant knowledge base context was found. You may use your general culinary knowledge, but ONLY for food/cooking topics. Maintain strict scope."
+
+
+class _HyperscanKeywordMatcher:
+    """Match a fixed keyword set with one Hyperscan database (compiled DFA, SIMD literal matching)."""
+
+    def __init__(self, keywords: Iterable[str]) -> None:
+        self.database = hyperscan.Database()
+        expressions = [re.escape(keyword).encode("utf-8") for keyword in keywords]
+        self.database.compile(
+            expressions=expressions,
+            ids=list(range(len(expressions))),
+            flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(expressions),
+        )
+        # The database shares one scratch space, which a scan can't use concurrently
+        self.lock = threading.Lock()
+
+    def search(self, text: str) -> bool:
+        """Return True if any keyword occurs in text."""
+        matches: List[int] = []
+
+        def on_match(match_id: int, start: int, end: int, flags: int, context: object) -> None:
+            matches.append(match_id)
+
+        with self.lock:
+            self.database.scan(text.encode("utf-8"), match_event_handler=on_match)
+        return bool(matches)
+
+
+# Shown to the user when an answer times out
+TEXT_TIMEOUT_MESSAGE = "The request took too long to process. Please try again with a simpler question or check your connection."
+IMAGE_TIMEOUT_MESSAGE = "Image analysis took too long. Please try again with a smaller image or a simpler question."
+
+
+# Only texts up to this length go through the lru caches below, so the caches can't keep
+# arbitrarily large request messages alive
+_CACHED_QUERY_MAX_LENGTH = 1024
+
+
+def _normalize_query(query: str) -> str:
+    return ' '.join(FoodChatbot._PUNCT_RE.sub('', query.lower()).split())
+
+
+def _has_food_keyword(query: str) -> bool:
+    # Single Hyperscan or regex scan of the normalized query
+    normalized = FoodChatbot.normalize_query(query)
+    if FoodChatbot._FOOD_KEYWORDS_HS is not None:
+        return FoodChatbot._FOOD_KEYWORDS_HS.search(normalized)
+    return FoodChatbot._FOOD_KEYWORDS_RE.search(normalized) is not None
+
+
+_normalize_query_cached = lru_cache(maxsize=4096)(_normalize_query)
+_has_food_keyword_cached = lru_cache(maxsize=4096)(_has_food_keyword)
+
+
+@dataclass
+class _AnswerPlan:
+    """State of one text answer, shared by the sync, streaming and async answer paths."""
+    question: str
+    history: Sequence[dict] | None
+    history_length: int
+    is_food_related: bool
+    cache_key: bytes = b""
+    # Set directly for cached and canned replies, or after the LLM call
+    answer: str = ""
+    # Chat messages for the LLM; None when no LLM call is needed
+    messages: List[dict] | None = None
+    num_retrieved_docs: int = 0
+    cached: bool = False
+    canned_reply: bool = False
+
 
 class FoodChatbot:
-    # Keywords that indicate food/cooking-related topics
-    FOOD_KEYWORDS = {
+    # Keywords that indicate food/cooking-related topics; frozen because the compiled regex below is built from them
+    FOOD_KEYWORDS: frozenset[str] = frozenset({
         "cook", "recipe", "meal", "food", "dinner", "lunch", "breakfast", "snack",
         "ingredient", "calorie", "calories", "nutrition", "diet", "prep", "preparation",
         "kitchen", "bake", "roast", "grill", "fry", "steam", "boil", "sauté",
@@ -23,34 +151,87 @@ class FoodChatbot:
         "allergy", "vegetarian", "vegan", "pescatarian", "gluten", "dairy",
         "session", "chef", "cooking class", "meal plan", "prep time", "cook time",
         "calculate", "track", "photo", "upload", "estimate"
-    }
+    })
+    # Whole messages (after normalize_query) answered with a fixed reply instead of the LLM
+    GREETINGS: frozenset[str] = frozenset({
+        "hi", "hello", "hey", "hi there", "hello there", "hey there", "good morning",
+        "good afternoon", "good evening", "salam", "مرحبا", "اهلا", "أهلا", "السلام عليكم",
+    })
+    THANKS: frozenset[str] = frozenset({
+        "thanks", "thank you", "thx", "thanks a lot", "thank you so much", "thank you very much",
+        "شكرا", "شكرا لك", "شكرا جزيلا",
+    })
+    # Arabic, Arabic Supplement, Arabic Extended-A and Arabic Presentation Forms A/B
+    _ARABIC_CHARS = frozenset(
+        chr(code)
+        for start, end in ((0x0600, 0x06FF), (0x0750, 0x077F), (0x08A0, 0x08FF), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF))
+        for code in range(start, end + 1)
+    )
+    # Compiled once for all requests
+    _PUNCT_RE = re.compile(r'[^\w\s]')
+    _FOOD_KEYWORDS_RE = re.compile(_keyword_trie_pattern(FOOD_KEYWORDS))
+    # Faster equivalent of _FOOD_KEYWORDS_RE when hyperscan is installed
+    _FOOD_KEYWORDS_HS = _HyperscanKeywordMatcher(FOOD_KEYWORDS) if HYPERSCAN_AVAILABLE else None
 
     def __init__(self) -> None:
         self.system_prompt = SYSTEM_PROMPT
+        # System message for text chat; identical for every request so providers can cache it
+        self.chat_system_prompt = f"{SYSTEM_PROMPT}\n\n{CHAT_INSTRUCTIONS}"
+        # Retrieved documents keyed by (normalized query, n_results, vector store version)
+        # Values are (expires_at, documents); expires_at is inf when no TTL is configured
+        self.retrieval_cache: OrderedDict[Tuple[str, int, int], Tuple[float, Tuple[Document, ...]]] = OrderedDict()
+        self.retrieval_cache_lock = threading.Lock()
+        self.retrieval_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _has_arabic(text: str) -> bool:
+        # isascii() is O(1) on CPython, so English messages never scan their characters;
+        # otherwise isdisjoint stops at the first Arabic character
+        return not text.isascii() and not FoodChatbot._ARABIC_CHARS.isdisjoint(text)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Lowercase, remove punctuation and collapse whitespace (cached per query text)."""
+        if len(query) > _CACHED_QUERY_MAX_LENGTH:
+            return _normalize_query(query)
+        return _normalize_query_cached(query)
+
+    @staticmethod
+    def _has_food_keyword(query: str) -> bool:
+        """Check if any food keyword appears in the query (cached per query text)."""
+        if len(query) > _CACHED_QUERY_MAX_LENGTH:
+            return _has_food_keyword(query)
+        return _has_food_keyword_cached(query)
 
     def contains_arabic(self, text: str) -> bool:
         """Check if text contains Arabic characters."""
-        arabic_pattern = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
-        return bool(arabic_pattern.search(text))
+        return self._has_arabic(text)
 
-    def is_food_related(self, query: str, history: Sequence[dict] | None = None) -> bool:
+    def is_food_related(
+        self,
+        query: str,
+        history: Sequence[dict] | None = None,
+        recent_image: bool | None = None,
+    ) -> bool:
         """
         Check if query is related to food/cooking topics.
         
         Args:
             query: The user's question or message
             history: Optional conversation history to check for context (e.g., recent image analysis)
+            recent_image: Whether one of the last 2 turns was an image analysis, if the caller
+                already tracks it; when None, the history is scanned for "[IMAGE]" turns
         
         Returns:
             True if the query is food-related, False otherwise
         """
-        # Normalize query: remove punctuation and extra spaces for better matching
-        query_normalized = re.sub(r'[^\w\s]', '', query.lower())
-        query_normalized = ' '.join(query_normalized.split())
-        # Check if any keyword appears in the normalized query
-        if any(keyword in query_normalized for keyword in self.FOOD_KEYWORDS):
+        # Keyword scan depends only on the query text, so repeated phrasings hit the cache
+        if self._has_food_keyword(query):
             return True
         
+        if recent_image is not None:
+            return recent_image
+        
         # Check if this is a follow-up to image analysis
         # If history exists and contains recent image analysis, treat follow-up questions as food-related
         if history:
@@ -65,25 +246,66 @@ class FoodChatbot:
         return False
 
     def build_context(self, query: str) -> List[Document]:
-        return vector_store.query(query, n_results=settings.max_context_documents)
+        """
+        Retrieve knowledge base documents for a query.
+        
+        Results are cached on the normalized query, so casing/punctuation variants
+        ("Vegan recipes?" vs "vegan recipes") reuse one embedding + search. The cache
+        is keyed on vector_store.version and never serves results from before an ingest
+        in this process; the TTL bounds staleness after an ingest in another worker.
+        """
+        limit = settings.max_context_documents
+        if settings.retrieval_cache_size <= 0:
+            return vector_store.query(query, n_results=limit)
+        
+        key = (self.normalize_query(query) or query, limit, vector_store.version)
+        now = time.monotonic()
+        with self.retrieval_cache_lock:
+            entry = self.retrieval_cache.get(key)
+            if entry is not None:
+                expires_at, cached = entry
+                if expires_at > now:
+                    self.retrieval_cache.move_to_end(key)
+                    self.retrieval_cache_stats["hits"] += 1
+                    return list(cached)
+                del self.retrieval_cache[key]
+            self.retrieval_cache_stats["misses"] += 1
+        
+        docs = vector_store.query(query, n_results=limit)
+        # Empty results may be a transient query failure, so only cache hits
+        if docs:
+            ttl = settings.retrieval_cache_ttl_seconds
+            expires_at = now + ttl if ttl > 0 else float("inf")
+            with self.retrieval_cache_lock:
+                self.retrieval_cache[key] = (expires_at, tuple(docs))
+                self.retrieval_cache.move_to_end(key)
+                while len(self.retrieval_cache) > settings.retrieval_cache_size:
+                    self.retrieval_cache.popitem(last=False)
+                    self.retrieval_cache_stats["evictions"] += 1
+        return docs
+
+    def retrieval_cache_info(self) -> dict:
+        """Return retrieval cache counters (hits, misses, evictions) and its current size."""
+        with self.retrieval_cache_lock:
+            return {**self.retrieval_cache_stats, "size": len(self.retrieval_cache)}
+
+    def recent_history(self, history: Sequence[dict] | None) -> Sequence[dict] | None:
+        """Keep only the last settings.max_history_turns turns, bounding prompt size in long conversations."""
+        limit = settings.max_history_turns
+        if history and limit > 0 and len(history) > limit:
+            return history[-limit:]
+        return history
 
     def format_history(self, history: Sequence[dict] | None) -> str:
         if not history:
             return "(none)"
-        formatted = []
-        for turn in history:
-            formatted.append(f"User: {turn['user']}")
-            formatted.append(f"Assistant: {turn['assistant']}")
-        return "\n".join(formatted)
+        # One string per turn; a list (not a generator) because join materializes it anyway
+        return "\n".join(["User: %s\nAssistant: %s" % pair for pair in map(turn_fields, history)])
 
     def format_context(self, docs: Sequence[Document]) -> str:
         if not docs:
             return "No matching knowledge found."
-        chunks = []
-        for doc in docs:
-            prefix = doc.metadata.get("type", "doc")
-            chunks.append(f"[{prefix}:{doc.doc_id}] {doc.content}")
-        return "\n".join(chunks)
+        return "\n".join([f"[{doc.metadata.get('type', 'doc')}:{doc.doc_id}] {doc.content}" for doc in docs])
     
     def has_relevant_context(self, docs: Sequence[Document]) -> bool:
         """
@@ -96,110 +318,224 @@ class FoodChatbot:
         # The vector store should already filter by relevance
         return True
 
-    def build_prompt(self, question: str, history: Sequence[dict] | None, docs: Sequence[Document]) -> str:
-        return CHAT_PROMPT_TEMPLATE.format(
-            system_prompt=self.system_prompt,
-            history=self.format_history(history),
-            context=self.format_context(docs),
-            question=question,
-        )
+    def history_messages(self, history: Sequence[dict] | None) -> List[dict]:
+        """Turn conversation history into alternating user/assistant chat messages."""
+        messages: List[dict] = []
+        for user, assistant in map(turn_fields, history or ()):
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        return messages
 
-    def answer(self, question: str, history: Sequence[dict] | None = None, user_id: str | None = None, conversation_id: str | None = None) -> str:
-        is_food_related = self.is_food_related(question, history=history)
-        history_length = len(history) if history else 0
-        num_retrieved_docs = 0
-        answer = ""
+    def build_messages(self, question: str, history: Sequence[dict] | None, docs: Sequence[Document]) -> List[dict]:
+        """
+        Build the chat messages for a food-related question.
+        
+        Ordered from most to least stable: the fixed system message, then the history
+        turns, then one user message with the retrieved context and question. Each request
+        repeats the previous one's prefix, which keeps provider-side prompt caching effective.
+        """
+        # Add explicit instruction about knowledge base priority
+        note = _CONTEXT_FOUND_NOTE if self.has_relevant_context(docs) else _NO_CONTEXT_NOTE
+        prompt = "".join((
+            _USER_PROMPT_HEAD,
+            self.format_context(docs),
+            _USER_PROMPT_MIDDLE,
+            question,
+            _USER_PROMPT_TAIL,
+            note,
+        ))
+        return [
+            {"role": "system", "content": self.chat_system_prompt},
+            *self.history_messages(history),
+            {"role": "user", "content": prompt},
+        ]
+
+    def answer(
+        self,
+        question: str,
+        history: Sequence[dict] | None = None,
+        user_id: str | None = None,
+        conversation_id: str | None = None,
+        recent_image: bool | None = None,
+    ) -> str:
+        return "".join(self._answer_pieces(question, history, user_id, conversation_id, recent_image, stream=False))
+
+    def answer_stream(
+        self,
+        question: str,
+        history: Sequence[dict] | None = None,
+        user_id: str | None = None,
+        conversation_id: str | None = None,
+        recent_image: bool | None = None,
+    ) -> Iterator[str]:
+        """
+        Like answer(), but yield the answer in pieces as the LLM generates it.
+        Cached and canned answers are yielded whole. The full answer is cached and logged
+        once the last piece has been produced.
+        """
+        return self._answer_pieces(question, history, user_id, conversation_id, recent_image, stream=True)
+
+    async def aanswer(
+        self,
+        question: str,
+        history: Sequence[dict] | None = None,
+        user_id: str | None = None,
+        conversation_id: str | None = None,
+        recent_image: bool | None = None,
+    ) -> str:
+        """
+        Async version of answer() for use on an event loop.
         
+        The LLM call is awaited instead of holding a worker thread for its whole duration;
+        knowledge base retrieval and logging, which block, run in worker threads.
+        """
+        plan = self._new_plan(question, history, recent_image)
         try:
-            # Quick scope check - if clearly not food-related, add explicit instruction
-            if not is_food_related:
-                # Let LLM handle it naturally but with context-aware redirect
-                history_context = "There is conversation history, so do NOT repeat your introduction. Continue naturally." if history else "This is the first message, so you can introduce yourself if appropriate."
-                prompt = (
-                    f"User message: {question}\n\n"
-                    f"This message does NOT appear to be about food, cooking, recipes, meals, or nutrition. "
-                    f"{history_context} "
-                    "Please acknowledge it naturally (if it's a greeting, acknowledge it; if it's a question, "
-                    "politely decline) and redirect to food topics. Be contextual and friendly, but always redirect "
-                    "to your role as a culinary assistant. If there's history, be conversational and don't repeat yourself."
-                )
-                messages = [
-                    {"role": "system", "content": self.system_prompt},
-                ]
-                # Include history in messages for context
-                if history:
-                    for turn in history:
-                        messages.append({"role": "user", "content": turn["user"]})
-                        messages.append({"role": "assistant", "content": turn["assistant"]})
-                messages.append({"role": "user", "content": prompt})
-                answer = llm_client.chat(messages, timeout=settings.llm_timeout_seconds)
+            await asyncio.to_thread(self._plan_answer, plan, user_id)
+            if plan.messages is not None:
+                plan.answer = await llm_client.achat(plan.messages, timeout=settings.llm_timeout_seconds)
+            await asyncio.to_thread(self._record_answer, plan, user_id, conversation_id, False)
+            return plan.answer
+        except TimeoutError as e:
+            self._log_answer_error(plan, e, user_id, timeout=True)
+            # Re-raise with user-friendly message
+            raise TimeoutError(TEXT_TIMEOUT_MESSAGE) from e
+        except Exception as e:
+            self._log_answer_error(plan, e, user_id)
+            raise
+
+    def _answer_pieces(
+        self,
+        question: str,
+        history: Sequence[dict] | None,
+        user_id: str | None,
+        conversation_id: str | None,
+        recent_image: bool | None,
+        stream: bool,
+    ) -> Iterator[str]:
+        """Shared implementation of answer() and answer_stream(); non-streaming answers arrive as one piece."""
+        plan = self._new_plan(question, history, recent_image)
+        try:
+            self._plan_answer(plan, user_id)
+            if plan.messages is None:
+                yield plan.answer
+            elif stream:
+                pieces = []
+                for piece in llm_client.chat_stream(plan.messages, timeout=settings.llm_timeout_seconds):
+                    pieces.append(piece)
+                    yield piece
+                plan.answer = "".join(pieces).strip()
             else:
-                # Always query knowledge base first for food-related questions
-                docs = self.build_context(question)
-                num_retrieved_docs = len(docs)
-                has_kb_context = self.has_relevant_context(docs)
-                
-                # Build prompt with knowledge base context
-                prompt = self.build_prompt(question, history, docs)
-                
-                # Add explicit instruction about knowledge base priority
-                if has_kb_context:
-                    prompt += "\n\nCRITICAL: You have RetrievedContext above. You MUST prioritize and use information from the RetrievedContext as your primary source. Only use general knowledge if the context doesn't fully answer the question."
-                else:
-                    prompt += "\n\nNOTE: No relevant knowledge base context was found. You may use your general culinary knowledge, but ONLY for food/cooking topics. Maintain strict scope."
-                
-                messages = [
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": prompt},
-                ]
-                answer = llm_client.chat(messages, timeout=settings.llm_timeout_seconds)
-            
-            # Log the conversation
-            conversation_logger.log_conversation(
-                question=question,
-                answer=answer,
-                is_food_related=is_food_related,
-                num_retrieved_docs=num_retrieved_docs,
-                history_length=history_length,
-                user_id=user_id,
-                conversation_id=conversation_id,
-                metadata={
-                    "model": settings.llm_model,
-                    "temperature": settings.temperature,
-                },
-            )
-            
-            return answer
-            
+                plan.answer = llm_client.chat(plan.messages, timeout=settings.llm_timeout_seconds)
+                yield plan.answer
+            self._record_answer(plan, user_id, conversation_id, stream)
         except TimeoutError as e:
-            # Log timeout errors with context
-            conversation_logger.log_error(
-                e,
-                context={
-                    "question": question,
-                    "is_food_related": is_food_related,
-                    "history_length": history_length,
-                    "user_id": user_id,
-                    "error_type": "timeout",
-                },
-            )
+            self._log_answer_error(plan, e, user_id, timeout=True)
             # Re-raise with user-friendly message
-            raise TimeoutError(
-                f"The request took too long to process. Please try again with a simpler question or check your connection."
-            ) from e
+            raise TimeoutError(TEXT_TIMEOUT_MESSAGE) from e
         except Exception as e:
-            # Log errors
-            conversation_logger.log_error(
-                e,
-                context={
-                    "question": question,
-                    "is_food_related": is_food_related,
-                    "history_length": history_length,
-                    "user_id": user_id,
-                },
-            )
+            self._log_answer_error(plan, e, user_id)
             raise
 
+    def _new_plan(self, question: str, history: Sequence[dict] | None, recent_image: bool | None) -> _AnswerPlan:
+        """Start answering a question: trim the history and classify the question."""
+        history_length = len(history) if history else 0
+        history = self.recent_history(history)
+        is_food_related = self.is_food_related(question, history=history, recent_image=recent_image)
+        return _AnswerPlan(question=question, history=history, history_length=history_length, is_food_related=is_food_related)
+
+    def _plan_answer(self, plan: _AnswerPlan, user_id: str | None) -> None:
+        """
+        Decide how to answer: set plan.answer for cached and canned replies, otherwise
+        plan.messages for the LLM (retrieving knowledge base context for food questions).
+        """
+        question, history = plan.question, plan.history
+        # Identical question + history from the same user: reuse the previous answer
+        plan.cache_key = response_cache.make_key(user_id, question, history)
+        cached_answer = response_cache.get(plan.cache_key)
+        if cached_answer is not None:
+            plan.answer = cached_answer
+            plan.cached = True
+        # Bare greeting or thanks: a fixed reply, no need for the LLM. Only these clearly
+        # off-topic messages are short-circuited; the keyword scan misses many food questions
+        # ("Is chicken healthy?", any Arabic message), so everything else goes to the LLM
+        elif not plan.is_food_related and (small_talk := self.small_talk_reply(question, first_turn=not history)):
+            plan.answer = small_talk
+            plan.canned_reply = True
+        # Quick scope check - if clearly not food-related, add explicit instruction
+        elif not plan.is_food_related:
+            # Let LLM handle it naturally but with context-aware redirect
+            history_context = "There is conversation history, so do NOT repeat your introduction. Continue naturally." if history else "This is the first message, so you can introduce yourself if appropriate."
+            prompt = (
+                f"User message: {question}\n\n"
+                f"This message does NOT appear to be about food, cooking, recipes, meals, or nutrition. "
+                f"{history_context} "
+                "Please acknowledge it naturally (if it's a greeting, acknowledge it; if it's a question, "
+                "politely decline) and redirect to food topics. Be contextual and friendly, but always redirect "
+                "to your role as a culinary assistant. If there's history, be conversational and don't repeat yourself."
+            )
+            # Same system message and history layout as food questions, so the cached prefix is shared
+            plan.messages = [
+                {"role": "system", "content": self.chat_system_prompt},
+                *self.history_messages(history),
+                {"role": "user", "content": prompt},
+            ]
+        else:
+            # Always query knowledge base first for food-related questions
+            docs = self.build_context(question)
+            plan.num_retrieved_docs = len(docs)
+            
+            # Build messages with knowledge base context
+            plan.messages = self.build_messages(question, history, docs)
+
+    def small_talk_reply(self, question: str, first_turn: bool = False) -> str | None:
+        """
+        Return the fixed reply for a message that is only a greeting or thanks, else None.
+        A greeting that opens the conversation gets the reply that introduces the assistant.
+        """
+        normalized = self.normalize_query(question)
+        if normalized in self.GREETINGS:
+            if first_turn:
+                return INTRO_REPLY_AR if self.contains_arabic(question) else INTRO_REPLY_EN
+            return GREETING_REPLY_AR if self.contains_arabic(question) else GREETING_REPLY_EN
+        if normalized in self.THANKS:
+            return THANKS_REPLY_AR if self.contains_arabic(question) else THANKS_REPLY_EN
+        return None
+
+    def _record_answer(self, plan: _AnswerPlan, user_id: str | None, conversation_id: str | None, streamed: bool) -> None:
+        """Cache a freshly generated answer and log the conversation."""
+        if not plan.cached:
+            response_cache.set(plan.cache_key, plan.answer)
+        
+        conversation_logger.log_conversation(
+            question=plan.question,
+            answer=plan.answer,
+            is_food_related=plan.is_food_related,
+            num_retrieved_docs=plan.num_retrieved_docs,
+            history_length=plan.history_length,
+            user_id=user_id,
+            conversation_id=conversation_id,
+            metadata={
+                "model": "rule-based" if plan.canned_reply else settings.llm_model,
+                "temperature": settings.temperature,
+                "cached": plan.cached,
+                "canned_reply": plan.canned_reply,
+                "streamed": streamed,
+            },
+        )
+
+    def _log_answer_error(self, plan: _AnswerPlan, error: Exception, user_id: str | None, timeout: bool = False) -> None:
+        """Log a failed text answer with its context."""
+        context = {
+            "question": plan.question,
+            "is_food_related": plan.is_food_related,
+            "history_length": plan.history_length,
+            "user_id": user_id,
+        }
+        if timeout:
+            context["error_type"] = "timeout"
+        conversation_logger.log_error(error, context=context)
+
     def answer_with_image(
         self,
         image_data: str | bytes,
@@ -223,131 +559,153 @@ class FoodChatbot:
             conversation_id: Optional conversation identifier
         """
         try:
-            # Encode image to base64 (with aggressive optimization: 1024x1024, quality 75)
-            image_base64 = encode_image_to_base64(image_data)
+            image_data_url = self._encode_image(image_data)
+            history_length = len(history) if history else 0
+            analysis_prompt = self._image_analysis_prompt(question, history)
             
-            # Validation is now combined with analysis in a single API call for better performance
-            # This eliminates the separate validation call, reducing processing time significantly
+            # Analyze image (validation is combined in the prompt)
+            answer = llm_client.analyze_image(image_data_url, analysis_prompt, timeout=settings.vision_timeout_seconds)
             
-            # Determine which prompt to use based on question
-            question_lower = question.lower()
-            if "calorie" in question_lower or "calories" in question_lower:
-                base_prompt = CALORIE_FOCUS_PROMPT
-            else:
-                base_prompt = IMAGE_ANALYSIS_PROMPT
+            return self._record_image_answer(answer, question, history_length, user_id, conversation_id, image_url)
             
-            # Build the analysis prompt with conversation history if available
-            if history and len(history) > 0:
-                # Format history for inclusion in prompt
-                history_text = "\n".join([
-                    f"User: {turn.get('user', '')}\nAssistant: {turn.get('assistant', '')}"
-                    for turn in history
-                ])
-                analysis_prompt = f"""{base_prompt}
-
-<ConversationHistory>
-{history_text}
-</ConversationHistory>
-
-IMPORTANT: This is a follow-up question in an ongoing conversation. Continue naturally and reference previous context when relevant. Do NOT repeat introductions or start from the beginning. If the user is asking about a previous image analysis, reference that analysis naturally.
+        except TimeoutError as e:
+            self._log_image_error(e, question, user_id, timeout=True)
+            # Re-raise with user-friendly message
+            raise TimeoutError(IMAGE_TIMEOUT_MESSAGE) from e
+        except Exception as e:
+            self._log_image_error(e, question, user_id)
+            raise
 
-User question: {question}"""
-            else:
-                analysis_prompt = f"{base_prompt}\n\nUser question: {question}"
-            
-            # Add language instruction to respond in the same language as the question
-            analysis_prompt = f"{analysis_prompt}\n\nIMPORTANT: Respond in the same language as the user's question. If the question is in Arabic, respond in Arabic. If the question is in English, respond in English."
+    async def aanswer_with_image(
+        self,
+        image_data: str | bytes,
+        question: str = "What is in this image? Estimate the calories.",
+        history: Sequence[dict] | None = None,
+        user_id: str | None = None,
+        conversation_id: str | None = None,
+        image_url: str | None = None,
+    ) -> str:
+        """
+        Async version of answer_with_image() for use on an event loop.
+        
+        The vision call is awaited; image encoding and logging run in worker threads.
+        """
+        try:
+            image_data_url = await asyncio.to_thread(self._encode_image, image_data)
+            history_length = len(history) if history else 0
+            analysis_prompt = self._image_analysis_prompt(question, history)
             
             # Analyze image (validation is combined in the prompt)
-            answer = llm_client.analyze_image(image_base64, analysis_prompt, timeout=settings.vision_timeout_seconds)
-            
-            # Check if the response indicates the image is not food-related
-            # The prompt instructs the model to return "NOT_FOOD" if the image is not food-related
-            if answer.strip().upper() == "NOT_FOOD" or answer.strip().upper().startswith("NOT_FOOD"):
-                # Respond in the same language as the question
-                if self.contains_arabic(question):
-                    answer = (
-                        "أنا في، مساعدك الطهي. يمكنني فقط تحليل الصور المتعلقة بالطعام. "
-                        "يرجى تحميل صورة لوجبة أو طعام أو محتوى متعلق بالطهي."
-                    )
-                else:
-                    answer = (
-                        "I'm Vee, your culinary assistant. I can only analyze food-related images. "
-                        "Please upload an image of a meal, food, or cooking-related content."
-                    )
-                # Log the declined image
-                metadata = {
-                    "model": settings.vision_model,
-                    "has_image": True,
-                    "image_validated": False,
-                    "validation_combined": True,
-                }
-                if image_url:
-                    metadata["image_url"] = image_url
-                
-                conversation_logger.log_conversation(
-                    question=f"[IMAGE] {question}",
-                    answer=answer,
-                    is_food_related=False,
-                    num_retrieved_docs=0,
-                    history_length=0,
-                    user_id=user_id,
-                    conversation_id=conversation_id,
-                    metadata=metadata,
-                )
-                return answer
+            answer = await llm_client.aanalyze_image(image_data_url, analysis_prompt, timeout=settings.vision_timeout_seconds)
             
-            # Image is food-related - log the successful analysis
-            history_length = len(history) if history else 0
-            metadata = {
-                "model": settings.vision_model,
-                "has_image": True,
-                "image_validated": True,
-                "validation_combined": True,
-            }
-            if image_url:
-                metadata["image_url"] = image_url
-            
-            conversation_logger.log_conversation(
-                question=f"[IMAGE] {question}",
-                answer=answer,
-                is_food_related=True,
-                num_retrieved_docs=0,
-                history_length=history_length,
-                user_id=user_id,
-                conversation_id=conversation_id,
-                metadata=metadata,
+            return await asyncio.to_thread(
+                self._record_image_answer, answer, question, history_length, user_id, conversation_id, image_url
             )
             
-            return answer
-            
         except TimeoutError as e:
-            # Log timeout errors with context
-            conversation_logger.log_error(
-                e,
-                context={
-                    "question": f"[IMAGE] {question}",
-                    "is_food_related": True,
-                    "user_id": user_id,
-                    "has_image": True,
-                    "error_type": "timeout",
-                },
-            )
+            self._log_image_error(e, question, user_id, timeout=True)
             # Re-raise with user-friendly message
-            raise TimeoutError(
-                f"Image analysis took too long. Please try again with a smaller image or a simpler question."
-            ) from e
+            raise TimeoutError(IMAGE_TIMEOUT_MESSAGE) from e
         except Exception as e:
-            conversation_logger.log_error(
-                e,
-                context={
-                    "question": f"[IMAGE] {question}",
-                    "is_food_related": True,
-                    "user_id": user_id,
-                    "has_image": True,
-                },
-            )
+            self._log_image_error(e, question, user_id)
             raise
 
+    def _encode_image(self, image_data: str | bytes) -> str:
+        """Encode image to a base64 data URL (with aggressive optimization: 1024x1024, quality 75)."""
+        # Uploaded bytes go through the content-hash cache so resent photos aren't re-encoded
+        if isinstance(image_data, bytes):
+            return encode_image_data_url_cached(image_data)
+        return encode_image_to_data_url(image_data)
+
+    def _image_analysis_prompt(self, question: str, history: Sequence[dict] | None) -> str:
+        """Build the vision prompt, including recent history for follow-up questions."""
+        # Validation is now combined with analysis in a single API call for better performance
+        # This eliminates the separate validation call, reducing processing time significantly
+        
+        # Determine which prompt to use based on question (normalized form is cached per question)
+        if "calorie" in self.normalize_query(question):
+            base_prompt = CALORIE_FOCUS_PROMPT
+        else:
+            base_prompt = IMAGE_ANALYSIS_PROMPT
+        
+        # Build the analysis prompt with conversation history if available
+        history = self.recent_history(history)
+        if history:
+            # Format history for inclusion in prompt
+            history_text = self.format_history(history)
+            analysis_prompt = f"""{base_prompt}
+
+<ConversationHistory>
+{history_text}
+</ConversationHistory>
+
+IMPORTANT: This is a follow-up question in an ongoing conversation. Continue naturally and reference previous context when relevant. Do NOT repeat introductions or start from the beginning. If the user is asking about a previous image analysis, reference that analysis naturally.
+
+User question: {question}"""
+        else:
+            analysis_prompt = f"{base_prompt}\n\nUser question: {question}"
+        
+        # Add language instruction to respond in the same language as the question
+        return f"{analysis_prompt}\n\nIMPORTANT: Respond in the same language as the user's question. If the question is in Arabic, respond in Arabic. If the question is in English, respond in English."
+
+    def _record_image_answer(
+        self,
+        answer: str,
+        question: str,
+        history_length: int,
+        user_id: str | None,
+        conversation_id: str | None,
+        image_url: str | None,
+    ) -> str:
+        """Replace a NOT_FOOD verdict with the decline message, log the turn and return the answer."""
+        # Check if the response indicates the image is not food-related
+        # The prompt instructs the model to return "NOT_FOOD" if the image is not food-related
+        is_food = not answer.strip().upper().startswith("NOT_FOOD")
+        if not is_food:
+            # Respond in the same language as the question
+            if self.contains_arabic(question):
+                answer = (
+                    "أنا في، مساعدك الطهي. يمكنني فقط تحليل الصور المتعلقة بالطعام. "
+                    "يرجى تحميل صورة لوجبة أو طعام أو محتوى متعلق بالطهي."
+                )
+            else:
+                answer = (
+                    "I'm Vee, your culinary assistant. I can only analyze food-related images. "
+                    "Please upload an image of a meal, food, or cooking-related content."
+                )
+        
+        metadata = {
+            "model": settings.vision_model,
+            "has_image": True,
+            "image_validated": is_food,
+            "validation_combined": True,
+        }
+        if image_url:
+            metadata["image_url"] = image_url
+        
+        conversation_logger.log_conversation(
+            question=f"[IMAGE] {question}",
+            answer=answer,
+            is_food_related=is_food,
+            num_retrieved_docs=0,
+            # Declined images are logged without history
+            history_length=history_length if is_food else 0,
+            user_id=user_id,
+            conversation_id=conversation_id,
+            metadata=metadata,
+        )
+        return answer
+
+    def _log_image_error(self, error: Exception, question: str, user_id: str | None, timeout: bool = False) -> None:
+        """Log a failed image answer with its context."""
+        context = {
+            "question": f"[IMAGE] {question}",
+            "is_food_related": True,
+            "user_id": user_id,
+            "has_image": True,
+        }
+        if timeout:
+            context["error_type"] = "timeout"
+        conversation_logger.log_error(error, context=context)
 
 bot = FoodChatbot()
@@ -4,7 +4,7 @@ import os
 import socket
 import warnings
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
@@ -18,6 +18,9 @@ os.environ.setdefault("CHROMA_TELEMETRY_ANONYMIZED", "False")
 # Suppress Pydantic serialization warnings from LiteLLM
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 
+# Repository root, resolved once for all path defaults
+_PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
 
 def _detect_image_base_url() -> str:
     """
@@ -59,13 +62,11 @@ class Settings(BaseModel):
     """Central configuration for the food chatbot."""
 
     data_file: Path = Field(
-        default=Path(__file__).resolve().parents[1]
-        / "data"
-        / "synthetic_food_chatbot_data.json",
+        default=_PROJECT_ROOT / "data" / "synthetic_food_chatbot_data.json",
         description="Path to the synthetic knowledge base JSON.",
     )
     chroma_path: Path = Field(
-        default=Path(__file__).resolve().parents[1] / "chromadb_store",
+        default=_PROJECT_ROOT / "chromadb_store",
         description="Location for the persistent Chroma database.",
     )
     collection_name: str = Field(
@@ -109,6 +110,69 @@ class Settings(BaseModel):
         default=int(os.getenv("FOOD_BOT_VISION_TIMEOUT", "90")),
         description="Timeout in seconds for vision model API calls (image analysis). Default: 90 seconds.",
     )
+    # Response cache configuration
+    response_cache_size: int = Field(
+        default=int(os.getenv("FOOD_BOT_RESPONSE_CACHE_SIZE", "1024")),
+        description="Maximum number of chat answers kept in the in-memory response cache. Set to 0 to disable.",
+    )
+    response_cache_ttl_seconds: int = Field(
+        default=int(os.getenv("FOOD_BOT_RESPONSE_CACHE_TTL", "300")),
+        description="Seconds a cached chat answer stays valid. Default: 300 seconds.",
+    )
+    history_cache_ttl_seconds: int = Field(
+        default=int(os.getenv("FOOD_BOT_HISTORY_CACHE_TTL", "30")),
+        description="Seconds a user's history loaded from the conversation logs is reused before the log files are read again. Set to 0 to disable.",
+    )
+    max_history_turns: int = Field(
+        default=int(os.getenv("FOOD_BOT_MAX_HISTORY_TURNS", "6")),
+        description="Number of most recent conversation turns sent to the model. Older turns are dropped from the prompt. Set to 0 to send the full history.",
+    )
+    llm_concurrency: int = Field(
+        default=int(os.getenv("FOOD_BOT_LLM_CONCURRENCY", "8")),
+        description="Maximum number of LLM/vision calls in flight per worker. Default: 8.",
+    )
+    llm_max_connections: int = Field(
+        default=int(os.getenv("FOOD_BOT_LLM_MAX_CONNECTIONS", "100")),
+        description="Maximum number of pooled HTTP connections to the LLM provider. Default: 100.",
+    )
+    llm_max_keepalive_connections: int = Field(
+        default=int(os.getenv("FOOD_BOT_LLM_MAX_KEEPALIVE", "50")),
+        description="Maximum number of idle LLM provider connections kept open for reuse. Default: 50.",
+    )
+    llm_http2: bool = Field(
+        default=os.getenv("FOOD_BOT_LLM_HTTP2", "false").lower() == "true",
+        description="If True, talk to the LLM provider over HTTP/2 so concurrent calls share connections. Requires the h2 package (pip install httpx[http2]).",
+    )
+    # Retrieval batching configuration
+    retrieval_cache_size: int = Field(
+        default=int(os.getenv("FOOD_BOT_RETRIEVAL_CACHE_SIZE", "1024")),
+        description="Maximum number of knowledge base query results cached per normalized question. Set to 0 to disable.",
+    )
+    retrieval_cache_ttl_seconds: int = Field(
+        default=int(os.getenv("FOOD_BOT_RETRIEVAL_CACHE_TTL", "600")),
+        description="Seconds cached knowledge base results stay valid. Bounds staleness when another worker process ingests data. Set to 0 for no expiry.",
+    )
+    semantic_cache_size: int = Field(
+        default=int(os.getenv("FOOD_BOT_SEMANTIC_CACHE_SIZE", "1024")),
+        description="Maximum number of query embeddings whose knowledge base results are reused for similar questions. Set to 0 to disable.",
+    )
+    semantic_cache_threshold: float = Field(
+        default=float(os.getenv("FOOD_BOT_SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        description="Minimum cosine similarity between question embeddings for cached knowledge base results to be reused. Default: 0.92.",
+    )
+    retrieval_batch_size: int = Field(
+        default=int(os.getenv("FOOD_BOT_RETRIEVAL_BATCH_SIZE", "16")),
+        description="Maximum number of concurrent knowledge base queries embedded and searched together. Set to 1 to disable batching.",
+    )
+    retrieval_batch_wait_ms: int = Field(
+        default=int(os.getenv("FOOD_BOT_RETRIEVAL_BATCH_WAIT_MS", "5")),
+        description="Milliseconds a knowledge base query waits for others to join its batch. Default: 5 ms.",
+    )
+    # Conversation store configuration
+    redis_url: Optional[str] = Field(
+        default=os.getenv("FOOD_BOT_REDIS_URL"),
+        description="Redis URL (e.g. redis://localhost:6379/0) for storing conversations shared by all workers. If not set, conversations are kept in each worker's memory.",
+    )
     # AWS S3 logging configuration
     aws_s3_bucket: Optional[str] = Field(
         default=os.getenv("AWS_S3_LOG_BUCKET"),
@@ -140,6 +204,10 @@ class Settings(BaseModel):
         default=int(os.getenv("FOOD_BOT_MAX_AUDIO_SIZE_MB", "25")),
         description="Maximum audio file size in MB (OpenAI Whisper limit is 25MB).",
     )
+    max_image_size_mb: int = Field(
+        default=int(os.getenv("FOOD_BOT_MAX_IMAGE_SIZE_MB", "8")),
+        description="Maximum uploaded image size in MB. Larger uploads are rejected with 413 before being fully read.",
+    )
     # Image optimization configuration
     image_max_size: int = Field(
         default=int(os.getenv("FOOD_BOT_IMAGE_MAX_SIZE", "1024")),
@@ -149,19 +217,41 @@ class Settings(BaseModel):
         default=int(os.getenv("FOOD_BOT_IMAGE_QUALITY", "75")),
         description="JPEG quality for image compression (1-100). Lower values reduce file size and processing time. Default: 75 (aggressive optimization).",
     )
+    image_subsampling: int = Field(
+        default=int(os.getenv("FOOD_BOT_IMAGE_SUBSAMPLING", "2")),
+        description="JPEG chroma subsampling for images sent to the vision model: 0 (4:4:4), 1 (4:2:2) or 2 (4:2:0, smallest). Default: 2.",
+    )
+    image_progressive: bool = Field(
+        default=os.getenv("FOOD_BOT_IMAGE_PROGRESSIVE", "true").lower() == "true",
+        description="If True, encode images sent to the vision model as progressive JPEGs (typically 20-40% smaller for a few ms of extra encoding). Default: True.",
+    )
+    # validate_default: the value comes from the environment through the default, so a typo fails at startup
+    vision_image_detail: Literal["low", "high", "auto"] = Field(
+        default=os.getenv("FOOD_BOT_VISION_IMAGE_DETAIL", "auto"),
+        validate_default=True,
+        description="Detail level requested for images sent to the vision model: low, high or auto. 'low' sends a fixed small number of image tokens (much faster, less precise). Default: auto.",
+    )
     skip_image_validation: bool = Field(
         default=os.getenv("FOOD_BOT_SKIP_IMAGE_VALIDATION", "false").lower() == "true",
-        description="If True, skip separate validation step and combine validation with analysis (faster, but may process non-food images). Default: False.",
+        description="Unused: image validation is always combined with the analysis in a single vision call (the prompt answers NOT_FOOD for non-food images). Kept so existing environments still load.",
     )
     image_validation_model: str = Field(
         default=os.getenv("FOOD_BOT_IMAGE_VALIDATION_MODEL", "openai/gpt-4o-mini"),
-        description="Model to use for image validation (if separate validation is enabled). Use faster/cheaper model for validation. Default: gpt-4o-mini.",
+        description="Unused: there is no separate validation call; images are validated by settings.vision_model as part of the analysis. Kept so existing environments still load.",
     )
     # Image storage configuration
     image_upload_dir: Path = Field(
-        default=Path(__file__).resolve().parents[1] / "uploads" / "images",
+        default=_PROJECT_ROOT / "uploads" / "images",
         description="Directory for storing uploaded images. Organized by conversation_id.",
     )
+    image_hash_salt: str = Field(
+        default=os.getenv("FOOD_BOT_IMAGE_HASH_SALT", ""),
+        description="Secret key mixed into the content hash used as the stored image filename, so filenames can't be derived from known images. When empty, a random salt is generated on first start and kept in image_hash_salt_file. Changing it only affects new uploads.",
+    )
+    image_hash_salt_file: Path = Field(
+        default=Path(os.getenv("FOOD_BOT_IMAGE_HASH_SALT_FILE", _PROJECT_ROOT / "uploads" / ".image_hash_salt")),
+        description="Where the generated image hash salt is kept when FOOD_BOT_IMAGE_HASH_SALT is not set. Must be outside image_upload_dir, which is served publicly.",
+    )
     image_base_url: str = Field(
         default_factory=_detect_image_base_url,
         description="Base URL for serving uploaded images. Used to generate full image URLs in history. Auto-detects local vs server environment.",
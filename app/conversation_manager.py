@@ -1,16 +1,35 @@
 from __future__ import annotations
 
+import json
+import logging
+import operator
 import threading
+import time
+from collections import OrderedDict
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 
-from api.schemas import ChatTurn
+from app.config import settings
+
+# Try to import redis for a conversation store shared by all workers
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Reads (user, assistant) from a turn dict in one C-level call; used by the per-turn loops
+turn_fields = operator.itemgetter("user", "assistant")
 
 
 class ConversationManager:
     """
     Manages conversation history by conversation_id.
     Stores conversations in memory with automatic cleanup of old conversations.
+    Turns are kept as {"user": ..., "assistant": ...} dicts, the format the chatbot consumes.
     """
     
     def __init__(self, max_age_hours: int = 24):
@@ -20,12 +39,14 @@ class ConversationManager:
         Args:
             max_age_hours: Maximum age in hours before a conversation is considered stale (default: 24)
         """
-        self.conversations: Dict[str, List[ChatTurn]] = {}
-        self.conversation_metadata: Dict[str, dict] = {}  # Store user_id, created_at, last_accessed
+        # Ordered by last access (oldest first), so stale conversations are always at the front
+        self.conversations: OrderedDict[str, List[Dict[str, str]]] = OrderedDict()
+        # Store user_id, created_at, last_accessed (time.monotonic(), immune to wall-clock jumps)
+        self.conversation_metadata: Dict[str, dict] = {}
         self.max_age_hours = max_age_hours
         self.lock = threading.Lock()
     
-    def get_history(self, conversation_id: str) -> List[ChatTurn]:
+    def get_history(self, conversation_id: str) -> List[Dict[str, str]]:
         """
         Get conversation history for a given conversation_id.
         
@@ -33,13 +54,14 @@ class ConversationManager:
             conversation_id: Unique identifier for the conversation
             
         Returns:
-            List of ChatTurn objects representing the conversation history
+            List of {"user": ..., "assistant": ...} turns, oldest first. The list is a
+            copy; the turn dicts are shared and must not be modified.
         """
         with self.lock:
             # Clean up stale conversations
             self._cleanup_stale()
             
-            return self.conversations.get(conversation_id, [])
+            return list(self.conversations.get(conversation_id, ()))
     
     def add_turn(
         self,
@@ -47,6 +69,7 @@ class ConversationManager:
         user_message: str,
         assistant_message: str,
         user_id: Optional[str] = None,
+        is_image: bool = False,
     ) -> None:
         """
         Add a turn to the conversation history.
@@ -56,6 +79,7 @@ class ConversationManager:
             user_message: The user's message
             assistant_message: The assistant's response
             user_id: Optional user identifier
+            is_image: True if the turn is an image analysis
         """
         with self.lock:
             # Clean up stale conversations
@@ -67,18 +91,39 @@ class ConversationManager:
                 self.conversation_metadata[conversation_id] = {
                     "user_id": user_id,
                     "created_at": datetime.now(),
-                    "last_accessed": datetime.now(),
+                    "last_accessed": time.monotonic(),
+                    "last_image_turn": None,
                 }
             
             # Add the new turn
-            turn = ChatTurn(user=user_message, assistant=assistant_message)
-            self.conversations[conversation_id].append(turn)
+            self.conversations.move_to_end(conversation_id)
+            turns = self.conversations[conversation_id]
+            if is_image:
+                self.conversation_metadata[conversation_id]["last_image_turn"] = len(turns)
+            turns.append({"user": user_message, "assistant": assistant_message})
             
             # Update metadata
-            self.conversation_metadata[conversation_id]["last_accessed"] = datetime.now()
+            self.conversation_metadata[conversation_id]["last_accessed"] = time.monotonic()
             if user_id:
                 self.conversation_metadata[conversation_id]["user_id"] = user_id
     
+    def has_recent_image(self, conversation_id: str, within_turns: int = 2) -> bool:
+        """
+        Check whether one of the most recent turns of a conversation was an image analysis.
+        
+        Args:
+            conversation_id: Unique identifier for the conversation
+            within_turns: How many of the latest turns to consider (default: 2)
+            
+        Returns:
+            True if an image turn is among the last within_turns turns, False otherwise
+        """
+        with self.lock:
+            metadata = self.conversation_metadata.get(conversation_id)
+            if metadata is None or metadata["last_image_turn"] is None:
+                return False
+            return len(self.conversations[conversation_id]) - metadata["last_image_turn"] <= within_turns
+    
     def clear_conversation(self, conversation_id: str) -> bool:
         """
         Clear a specific conversation.
@@ -103,21 +148,144 @@ class ConversationManager:
             return len(self.conversations)
     
     def _cleanup_stale(self) -> None:
-        """Remove conversations that haven't been accessed recently."""
-        now = datetime.now()
-        stale_ids = [
-            conv_id
-            for conv_id, metadata in self.conversation_metadata.items()
-            if (now - metadata["last_accessed"]).total_seconds() > (self.max_age_hours * 3600)
-        ]
-        
-        for conv_id in stale_ids:
+        """
+        Remove conversations that haven't been accessed recently.
+        Only the oldest conversations are examined, so the cost is proportional to the
+        number removed rather than the number of active conversations.
+        """
+        cutoff = time.monotonic() - self.max_age_hours * 3600
+        while self.conversations:
+            conv_id = next(iter(self.conversations))
+            if self.conversation_metadata[conv_id]["last_accessed"] >= cutoff:
+                break
             del self.conversations[conv_id]
             del self.conversation_metadata[conv_id]
 
 
+class RedisConversationManager:
+    """
+    Conversation store backed by Redis, shared by every worker process.
+    
+    Same interface as ConversationManager. Each conversation is a Redis list of JSON turns
+    plus a metadata hash; both expire max_age_hours after the last turn, so Redis does the
+    stale cleanup.
+    """
+    
+    KEY_PREFIX = "vee:conv:"
+    
+    def __init__(self, url: str, max_age_hours: int = 24):
+        """
+        Initialize the conversation manager.
+        
+        Args:
+            url: Redis connection URL
+            max_age_hours: Hours without a new turn before a conversation expires (default: 24)
+        """
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.max_age_hours = max_age_hours
+    
+    def _keys(self, conversation_id: str) -> tuple[str, str]:
+        """Return the (turns, metadata) keys for a conversation."""
+        key = f"{self.KEY_PREFIX}{conversation_id}"
+        return key, f"{key}:meta"
+    
+    def get_history(self, conversation_id: str) -> List[Dict[str, str]]:
+        """
+        Get conversation history for a given conversation_id.
+        
+        Args:
+            conversation_id: Unique identifier for the conversation
+            
+        Returns:
+            List of {"user": ..., "assistant": ...} turns, oldest first
+        """
+        turns_key, _ = self._keys(conversation_id)
+        return [json.loads(turn) for turn in self.client.lrange(turns_key, 0, -1)]
+    
+    def add_turn(
+        self,
+        conversation_id: str,
+        user_message: str,
+        assistant_message: str,
+        user_id: Optional[str] = None,
+        is_image: bool = False,
+    ) -> None:
+        """
+        Add a turn to the conversation history.
+        
+        Args:
+            conversation_id: Unique identifier for the conversation
+            user_message: The user's message
+            assistant_message: The assistant's response
+            user_id: Optional user identifier
+            is_image: True if the turn is an image analysis
+        """
+        turns_key, meta_key = self._keys(conversation_id)
+        ttl_seconds = self.max_age_hours * 3600
+        turn = json.dumps({"user": user_message, "assistant": assistant_message}, ensure_ascii=False)
+        
+        pipe = self.client.pipeline()
+        pipe.rpush(turns_key, turn)
+        pipe.hsetnx(meta_key, "created_at", datetime.now().isoformat())
+        if user_id:
+            pipe.hset(meta_key, "user_id", user_id)
+        pipe.expire(turns_key, ttl_seconds)
+        pipe.expire(meta_key, ttl_seconds)
+        length = pipe.execute()[0]
+        if is_image:
+            self.client.hset(meta_key, "last_image_turn", length - 1)
+    
+    def has_recent_image(self, conversation_id: str, within_turns: int = 2) -> bool:
+        """
+        Check whether one of the most recent turns of a conversation was an image analysis.
+        
+        Args:
+            conversation_id: Unique identifier for the conversation
+            within_turns: How many of the latest turns to consider (default: 2)
+            
+        Returns:
+            True if an image turn is among the last within_turns turns, False otherwise
+        """
+        turns_key, meta_key = self._keys(conversation_id)
+        pipe = self.client.pipeline()
+        pipe.hget(meta_key, "last_image_turn")
+        pipe.llen(turns_key)
+        last_image_turn, length = pipe.execute()
+        if last_image_turn is None:
+            return False
+        return length - int(last_image_turn) <= within_turns
+    
+    def clear_conversation(self, conversation_id: str) -> bool:
+        """
+        Clear a specific conversation.
+        
+        Args:
+            conversation_id: Unique identifier for the conversation
+            
+        Returns:
+            True if conversation was found and cleared, False otherwise
+        """
+        return self.client.delete(*self._keys(conversation_id)) > 0
+    
+    def get_conversation_count(self) -> int:
+        """Get the total number of active conversations (scans the keyspace; not for hot paths)."""
+        return sum(
+            1 for key in self.client.scan_iter(match=f"{self.KEY_PREFIX}*", count=1000)
+            if not key.endswith(":meta")
+        )
+
+
+def _create_conversation_manager() -> ConversationManager | RedisConversationManager:
+    """Use Redis when configured and installed, otherwise keep conversations in memory."""
+    if settings.redis_url:
+        if REDIS_AVAILABLE:
+            return RedisConversationManager(settings.redis_url)
+        logger.warning("Redis URL configured but redis not installed. Install with: pip install redis")
+    return ConversationManager()
+
+
 # Global conversation manager instance
-conversation_manager = ConversationManager()
+conversation_manager = _create_conversation_manager()
 
 
 
@@ -1,18 +1,59 @@
 from __future__ import annotations
 
-import uuid
-from datetime import datetime
+import hashlib
+import os
+import secrets
 from pathlib import Path
 from typing import Optional, Tuple
 
 from app.config import settings
 
+def _load_generated_salt(salt_file: Path) -> bytes:
+    """
+    Read the salt kept in salt_file, generating and storing a random one on first start.
+    
+    Raises:
+        RuntimeError: If salt_file exists but is empty
+    """
+    try:
+        salt = salt_file.read_bytes().strip()
+    except FileNotFoundError:
+        salt = secrets.token_hex(32).encode("ascii")
+        salt_file.parent.mkdir(parents=True, exist_ok=True)
+        # Write a private temp file and link it into place, so workers starting at the same
+        # time all end up with the first one's salt and never read a half-written file
+        temp_file = salt_file.with_name(f"{salt_file.name}.{os.getpid()}.tmp")
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(salt)
+        try:
+            os.link(temp_file, salt_file)
+        except FileExistsError:
+            salt = salt_file.read_bytes().strip()
+        finally:
+            temp_file.unlink()
+    if not salt:
+        raise RuntimeError(f"Image hash salt file {salt_file} is empty; delete it or set FOOD_BOT_IMAGE_HASH_SALT")
+    return salt
+
+
+def _load_hash_key() -> bytes:
+    """Key for the image filename hash: settings.image_hash_salt, or the generated salt if unset."""
+    key = settings.image_hash_salt.encode("utf-8") or _load_generated_salt(Path(settings.image_hash_salt_file))
+    # BLAKE2b keys are limited to 64 bytes; longer salts are hashed down first
+    if len(key) > 64:
+        key = hashlib.blake2b(key).digest()
+    return key
+
+
+_hash_key = _load_hash_key()
+
 
 def save_image(
     image_data: bytes,
     conversation_id: str,
     original_filename: Optional[str] = None,
-) -> Tuple[str, str]:
+) -> Tuple[str, str, bool]:
     """
     Save image to filesystem organized by conversation_id.
     
@@ -22,16 +63,16 @@ def save_image(
         original_filename: Optional original filename to preserve extension
         
     Returns:
-        Tuple of (relative_path, full_url)
-        - relative_path: Path relative to uploads/images/ (e.g., "conv_id/filename.jpg")
+        Tuple of (relative_path, full_url, created)
+        - relative_path: Path relative to uploads/images/ (e.g., "conv_id/<content hash>.jpg")
         - full_url: Full URL for accessing the image (e.g., "https://chatbot.veeapp.online/images/conv_id/filename.jpg")
+        - created: False if the same image was already stored for this conversation
     """
     # Get upload directory from settings
     upload_dir = Path(settings.image_upload_dir)
     
-    # Create conversation-specific directory
+    # Conversation-specific directory, created on the first write that finds it missing
     conversation_dir = upload_dir / conversation_id
-    conversation_dir.mkdir(parents=True, exist_ok=True)
     
     # Determine file extension
     if original_filename:
@@ -42,15 +83,22 @@ def save_image(
     else:
         ext = '.jpg'  # Default extension
     
-    # Generate unique filename: timestamp_uuid.ext
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    unique_id = str(uuid.uuid4())[:8]
-    filename = f"{timestamp}_{unique_id}{ext}"
+    # Content-addressed filename: digest.ext (keyed with the salt so names can't be guessed from the image)
+    digest = hashlib.blake2b(image_data, digest_size=16, key=_hash_key).hexdigest()
+    filename = f"{digest}{ext}"
     
-    # Save image file
+    # Save image file; the same image uploaded again in this conversation is already on disk
     image_path = conversation_dir / filename
-    with open(image_path, "wb") as f:
-        f.write(image_data)
+    created = not image_path.exists()
+    if created:
+        try:
+            with open(image_path, "wb") as f:
+                f.write(image_data)
+        except FileNotFoundError:
+            # First image of this conversation (or its directory was cleaned up); create it
+            conversation_dir.mkdir(parents=True, exist_ok=True)
+            with open(image_path, "wb") as f:
+                f.write(image_data)
     
     # Generate relative path (for internal use)
     relative_path = f"{conversation_id}/{filename}"
@@ -59,4 +107,14 @@ def save_image(
     base_url = settings.image_base_url.rstrip("/")
     full_url = f"{base_url}/{relative_path}"
     
-    return relative_path, full_url
+    return relative_path, full_url, created
+
+
+def delete_image(relative_path: str) -> None:
+    """
+    Delete a stored image (e.g. one saved for a turn that then failed).
+    
+    Args:
+        relative_path: Path relative to uploads/images/, as returned by save_image
+    """
+    (Path(settings.image_upload_dir) / relative_path).unlink(missing_ok=True)
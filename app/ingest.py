@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-import json
 from pathlib import Path
-from typing import Dict, Iterable, List
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List
+
+import orjson
 
 from app.config import settings
 from app.vector_store import Document, vector_store
@@ -15,121 +17,137 @@ class DatasetIngestor:
         self.data_path = data_path or settings.data_file
 
     def load_raw(self) -> Dict:
-        with open(self.data_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        # orjson parses straight from the file's bytes, several times faster than json.load
+        return orjson.loads(Path(self.data_path).read_bytes())
 
     def build_documents(self, payload: Dict) -> List[Document]:
-        documents: List[Document] = []
-        documents.extend(self._user_docs(payload.get("users", [])))
-        documents.extend(self._meal_plan_docs(payload.get("mealPlans", [])))
-        documents.extend(self._meal_docs(payload.get("meals", [])))
-        documents.extend(self._session_docs(payload.get("sessions", [])))
-        documents.extend(self._insight_docs(payload.get("calorieInsights", [])))
-        documents.extend(self._photo_docs(payload.get("photoCalorieEstimates", [])))
-        return documents
-
-    def _user_docs(self, users: Iterable[Dict]) -> List[Document]:
-        docs: List[Document] = []
-        for user in users:
-            content = (
-                f"User {user['name']} ({user['userId']}) goals: {', '.join(user['goals'])}. "
-                f"Preferences: {', '.join(user['dietaryPreferences'])}. Allergies: {', '.join(user.get('allergies', []) or ['none'])}. "
-                f"Active plan: {user['activePlanId']}. Sessions: {', '.join(user['sessionHistory'])}."
+        return list(self.iter_documents(payload))
+
+    def iter_documents(self, payload: Dict) -> Iterator[Document]:
+        """Yield the documents for every section of the payload, built one at a time."""
+        return chain(
+            self._user_docs(payload.get("users", [])),
+            self._meal_plan_docs(payload.get("mealPlans", [])),
+            self._meal_docs(payload.get("meals", [])),
+            self._session_docs(payload.get("sessions", [])),
+            self._insight_docs(payload.get("calorieInsights", [])),
+            self._photo_docs(payload.get("photoCalorieEstimates", [])),
+        )
+
+    def _user_docs(self, users: Iterable[Dict]) -> Iterator[Document]:
+        return (
+            Document(
+                doc_id=f"user::{user['userId']}",
+                content=(
+                    f"User {user['name']} ({user['userId']}) goals: {', '.join(user['goals'])}. "
+                    f"Preferences: {', '.join(user['dietaryPreferences'])}. Allergies: {', '.join(user.get('allergies', []) or ['none'])}. "
+                    f"Active plan: {user['activePlanId']}. Sessions: {', '.join(user['sessionHistory'])}."
+                ),
+                metadata={
+                    "type": "user_profile",
+                    "userId": user["userId"],
+                    "timezone": user["timezone"],
+                },
             )
-            metadata = {
-                "type": "user_profile",
-                "userId": user["userId"],
-                "timezone": user["timezone"],
-            }
-            docs.append(Document(doc_id=f"user::{user['userId']}", content=content, metadata=metadata))
-        return docs
-
-    def _meal_plan_docs(self, plans: Iterable[Dict]) -> List[Document]:
-        docs: List[Document] = []
-        for plan in plans:
-            content = (
-                f"Meal plan {plan['name']} ({plan['planId']}) lasts {plan['durationWeeks']} weeks at {plan['dailyCalories']} kcal/day. "
-                f"Macro split protein {plan['macros']['protein']}%, carbs {plan['macros']['carbs']}%, fat {plan['macros']['fat']}%. Focus: {plan['focus']}."
+            for user in users
+        )
+
+    def _meal_plan_docs(self, plans: Iterable[Dict]) -> Iterator[Document]:
+        return (
+            Document(
+                doc_id=f"plan::{plan['planId']}",
+                content=(
+                    f"Meal plan {plan['name']} ({plan['planId']}) lasts {plan['durationWeeks']} weeks at {plan['dailyCalories']} kcal/day. "
+                    f"Macro split protein {plan['macros']['protein']}%, carbs {plan['macros']['carbs']}%, fat {plan['macros']['fat']}%. Focus: {plan['focus']}."
+                ),
+                metadata={
+                    "type": "meal_plan",
+                    "planId": plan["planId"],
+                    "scheduledMeals": ", ".join(plan["scheduledMeals"]),
+                },
             )
-            metadata = {
-                "type": "meal_plan",
-                "planId": plan["planId"],
-                "scheduledMeals": ", ".join(plan["scheduledMeals"]),
-            }
-            docs.append(Document(doc_id=f"plan::{plan['planId']}", content=content, metadata=metadata))
-        return docs
-
-    def _meal_docs(self, meals: Iterable[Dict]) -> List[Document]:
-        docs: List[Document] = []
-        for meal in meals:
-            content = (
-                f"Meal {meal['name']} ({meal['mealId']}) is a {meal['mealType']} for {meal['servings']} servings. "
-                f"Prep {meal['prepTimeMinutes']} min, cook {meal['cookTimeMinutes']} min, {meal['calories']} kcal. "
-                f"Ingredients: {', '.join(i['name'] for i in meal['ingredients'])}. "
-                f"Nutrition -> protein {meal['nutrition']['protein']}g, carbs {meal['nutrition']['carbs']}g, fat {meal['nutrition']['fat']}g. "
-                f"Suitable for {', '.join(meal['suitableFor'])}. Tags: {', '.join(meal['tags'])}."
+            for plan in plans
+        )
+
+    def _meal_docs(self, meals: Iterable[Dict]) -> Iterator[Document]:
+        return (
+            Document(
+                doc_id=f"meal::{meal['mealId']}",
+                content=(
+                    f"Meal {meal['name']} ({meal['mealId']}) is a {meal['mealType']} for {meal['servings']} servings. "
+                    f"Prep {meal['prepTimeMinutes']} min, cook {meal['cookTimeMinutes']} min, {meal['calories']} kcal. "
+                    # join() materializes its input anyway; a list skips the generator frame
+                    f"Ingredients: {', '.join([i['name'] for i in meal['ingredients']])}. "
+                    f"Nutrition -> protein {meal['nutrition']['protein']}g, carbs {meal['nutrition']['carbs']}g, fat {meal['nutrition']['fat']}g. "
+                    f"Suitable for {', '.join(meal['suitableFor'])}. Tags: {', '.join(meal['tags'])}."
+                ),
+                metadata={
+                    "type": "meal",
+                    "mealId": meal["mealId"],
+                    "mealType": meal["mealType"],
+                },
             )
-            metadata = {
-                "type": "meal",
-                "mealId": meal["mealId"],
-                "mealType": meal["mealType"],
-            }
-            docs.append(Document(doc_id=f"meal::{meal['mealId']}", content=content, metadata=metadata))
-        return docs
-
-    def _session_docs(self, sessions: Iterable[Dict]) -> List[Document]:
-        docs: List[Document] = []
-        for session in sessions:
-            content = (
-                f"Session {session['title']} ({session['sessionId']}) is a {session['type']} led by {session['coach']} on {session['scheduledDate']}. "
-                f"Duration {session['durationMinutes']} minutes with {session['capacity']} seats ({session['booked']} booked). "
-                f"Topics: {', '.join(session['topics'])}. Prep: {', '.join(session['requiredPrep'] or ['none'])}. Materials: {', '.join(session['materials'])}."
+            for meal in meals
+        )
+
+    def _session_docs(self, sessions: Iterable[Dict]) -> Iterator[Document]:
+        return (
+            Document(
+                doc_id=f"session::{session['sessionId']}",
+                content=(
+                    f"Session {session['title']} ({session['sessionId']}) is a {session['type']} led by {session['coach']} on {session['scheduledDate']}. "
+                    f"Duration {session['durationMinutes']} minutes with {session['capacity']} seats ({session['booked']} booked). "
+                    f"Topics: {', '.join(session['topics'])}. Prep: {', '.join(session['requiredPrep'] or ['none'])}. Materials: {', '.join(session['materials'])}."
+                ),
+                metadata={
+                    "type": "session",
+                    "sessionId": session["sessionId"],
+                    "coach": session["coach"],
+                    "recordingAvailable": session["recordingAvailable"],
+                },
             )
-            metadata = {
-                "type": "session",
-                "sessionId": session["sessionId"],
-                "coach": session["coach"],
-                "recordingAvailable": session["recordingAvailable"],
-            }
-            docs.append(Document(doc_id=f"session::{session['sessionId']}", content=content, metadata=metadata))
-        return docs
-
-    def _insight_docs(self, insights: Iterable[Dict]) -> List[Document]:
-        docs: List[Document] = []
-        for insight in insights:
-            content = (
-                f"Calorie insight {insight['title']} ({insight['insightId']}) type {insight['type']} with data {insight['data']}. "
-                f"Action: {insight['recommendedAction']}."
+            for session in sessions
+        )
+
+    def _insight_docs(self, insights: Iterable[Dict]) -> Iterator[Document]:
+        return (
+            Document(
+                doc_id=f"insight::{insight['insightId']}",
+                content=(
+                    f"Calorie insight {insight['title']} ({insight['insightId']}) type {insight['type']} with data {insight['data']}. "
+                    f"Action: {insight['recommendedAction']}."
+                ),
+                metadata={
+                    "type": "insight",
+                    "insightId": insight["insightId"],
+                },
             )
-            metadata = {
-                "type": "insight",
-                "insightId": insight["insightId"],
-            }
-            docs.append(Document(doc_id=f"insight::{insight['insightId']}", content=content, metadata=metadata))
-        return docs
-
-    def _photo_docs(self, photos: Iterable[Dict]) -> List[Document]:
-        docs: List[Document] = []
-        for photo in photos:
-            content = (
-                f"Photo calorie estimate {photo['photoId']} from user {photo['userId']} guesses {photo['mealGuess']} "
-                f"at {photo['calorieEstimate']} kcal (confidence {photo['confidence']}). Ingredients: {', '.join(photo['detectedIngredients'])}."
+            for insight in insights
+        )
+
+    def _photo_docs(self, photos: Iterable[Dict]) -> Iterator[Document]:
+        return (
+            Document(
+                doc_id=f"photo::{photo['photoId']}",
+                content=(
+                    f"Photo calorie estimate {photo['photoId']} from user {photo['userId']} guesses {photo['mealGuess']} "
+                    f"at {photo['calorieEstimate']} kcal (confidence {photo['confidence']}). Ingredients: {', '.join(photo['detectedIngredients'])}."
+                ),
+                metadata={
+                    "type": "photo_estimate",
+                    "photoId": photo["photoId"],
+                    "userId": photo["userId"],
+                },
             )
-            metadata = {
-                "type": "photo_estimate",
-                "photoId": photo["photoId"],
-                "userId": photo["userId"],
-            }
-            docs.append(Document(doc_id=f"photo::{photo['photoId']}", content=content, metadata=metadata))
-        return docs
+            for photo in photos
+        )
 
     def run(self, reset: bool = True) -> int:
         payload = self.load_raw()
-        documents = self.build_documents(payload)
         if reset:
             vector_store.reset()
-        vector_store.add(documents)
-        return len(documents)
+        # Documents are built and embedded a batch at a time instead of all up front
+        return vector_store.add_iter(self.iter_documents(payload))
 
 
 def ingest_dataset(reset: bool = True) -> int:
@@ -1,11 +1,52 @@
 from __future__ import annotations
 
-from typing import Any, List, Mapping, Optional
+import atexit
+import logging
+from typing import Any, Iterator, List, Mapping, Optional
 
-from litellm import completion
+import httpx
+from litellm import acompletion, completion
 import litellm
 
 from app.config import settings
+from app.image_utils import to_image_data_url
+
+# Try to import h2 for HTTP/2 support in httpx
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Default endpoint for "openai/..." models when no api_base is configured
+OPENAI_API_BASE = "https://api.openai.com/v1"
+
+_http_limits = httpx.Limits(
+    max_connections=settings.llm_max_connections,
+    max_keepalive_connections=settings.llm_max_keepalive_connections,
+)
+_use_http2 = settings.llm_http2 and HTTP2_AVAILABLE
+if settings.llm_http2 and not HTTP2_AVAILABLE:
+    logger.warning("HTTP/2 enabled for LLM calls but h2 not installed. Install with: pip install httpx[http2]")
+
+# One pooled HTTP client shared by every LiteLLM call, so connections and TLS sessions
+# to the provider are kept alive between requests instead of being set up per call.
+# completion() uses the sync client, acompletion() the async one.
+http_client = httpx.Client(
+    limits=_http_limits,
+    timeout=httpx.Timeout(settings.vision_timeout_seconds),
+    http2=_use_http2,
+)
+async_http_client = httpx.AsyncClient(
+    limits=_http_limits,
+    timeout=httpx.Timeout(settings.vision_timeout_seconds),
+    http2=_use_http2,
+)
+litellm.client_session = http_client
+litellm.aclient_session = async_http_client
+atexit.register(http_client.close)
 
 
 class LLMClient:
@@ -23,6 +64,92 @@ class LLMClient:
         self.api_key = api_key or settings.llm_api_key
         self.api_base = api_base or settings.llm_api_base
 
+    def warm_up(self) -> None:
+        """
+        Open a pooled connection to the LLM provider ahead of the first chat request.
+        
+        Only the provider's base URL is contacted; failures are ignored since the first
+        real request simply connects as usual.
+        """
+        url = self.api_base or (OPENAI_API_BASE if self.model.startswith("openai/") else None)
+        if not url:
+            return
+        try:
+            http_client.head(url, timeout=5)
+        except httpx.HTTPError:
+            pass
+
+    async def awarm_up(self) -> None:
+        """Async version of warm_up(): opens a connection in the pool used by achat()/aanalyze_image()."""
+        url = self.api_base or (OPENAI_API_BASE if self.model.startswith("openai/") else None)
+        if not url:
+            return
+        try:
+            await async_http_client.head(url, timeout=5)
+        except httpx.HTTPError:
+            pass
+
+    def _completion_kwargs(
+        self,
+        model: str,
+        messages: List[Mapping[str, Any]],
+        timeout_seconds: int,
+        **extra: Any,
+    ) -> dict[str, Any]:
+        """Build the LiteLLM completion arguments shared by all calls."""
+        kwargs = {
+            "model": model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "timeout": timeout_seconds,
+            **extra,
+        }
+        if self.api_key:
+            kwargs["api_key"] = self.api_key
+        if self.api_base:
+            kwargs["api_base"] = self.api_base
+        return kwargs
+
+    @staticmethod
+    def _vision_messages(image_base64: str, prompt: str) -> List[dict]:
+        """Build the single user message carrying the prompt and the image (base64 or data URL)."""
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": to_image_data_url(image_base64),
+                            "detail": settings.vision_image_detail,
+                        },
+                    },
+                ],
+            }
+        ]
+
+    @staticmethod
+    def _response_text(response: Any, source: str) -> str:
+        """Extract the assistant's text from a completion response."""
+        if not response or "choices" not in response:
+            raise RuntimeError(f"No response from {source}")
+        return response["choices"][0]["message"]["content"].strip()
+
+    @staticmethod
+    def _chat_timeout_error(timeout_seconds: int) -> TimeoutError:
+        return TimeoutError(
+            f"LLM API call timed out after {timeout_seconds} seconds. "
+            "The request took too long to process. Please try again."
+        )
+
+    @staticmethod
+    def _vision_timeout_error(timeout_seconds: int) -> TimeoutError:
+        return TimeoutError(
+            f"Vision API call timed out after {timeout_seconds} seconds. "
+            "Image analysis took too long. Please try again with a smaller image or different prompt."
+        )
+
     def chat(self, messages: List[Mapping[str, Any]], timeout: Optional[int] = None) -> str:
         """
         Send chat messages to the LLM.
@@ -39,31 +166,76 @@ class LLMClient:
             RuntimeError: If the response is invalid
         """
         timeout_seconds = timeout if timeout is not None else settings.llm_timeout_seconds
-        kwargs = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": self.temperature,
-            "timeout": timeout_seconds,
-        }
-        if self.api_key:
-            kwargs["api_key"] = self.api_key
-        if self.api_base:
-            kwargs["api_base"] = self.api_base
+        kwargs = self._completion_kwargs(self.model, messages, timeout_seconds)
 
         try:
             response = completion(**kwargs)
         except (TimeoutError, litellm.exceptions.Timeout) as e:
-            raise TimeoutError(
-                f"LLM API call timed out after {timeout_seconds} seconds. "
-                "The request took too long to process. Please try again."
-            ) from e
+            raise self._chat_timeout_error(timeout_seconds) from e
         except Exception as e:
             # Re-raise other exceptions with context
             raise RuntimeError(f"Error calling LLM API: {str(e)}") from e
         
-        if not response or "choices" not in response:
-            raise RuntimeError("No response from language model")
-        return response["choices"][0]["message"]["content"].strip()
+        return self._response_text(response, "language model")
+
+    async def achat(self, messages: List[Mapping[str, Any]], timeout: Optional[int] = None) -> str:
+        """
+        Async version of chat(): awaits the LLM without occupying a worker thread.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            timeout: Optional timeout in seconds. If None, uses settings.llm_timeout_seconds
+        
+        Returns:
+            The assistant's response text
+            
+        Raises:
+            TimeoutError: If the LLM call exceeds the timeout
+            RuntimeError: If the response is invalid
+        """
+        timeout_seconds = timeout if timeout is not None else settings.llm_timeout_seconds
+        kwargs = self._completion_kwargs(self.model, messages, timeout_seconds)
+
+        try:
+            response = await acompletion(**kwargs)
+        except (TimeoutError, litellm.exceptions.Timeout) as e:
+            raise self._chat_timeout_error(timeout_seconds) from e
+        except Exception as e:
+            # Re-raise other exceptions with context
+            raise RuntimeError(f"Error calling LLM API: {str(e)}") from e
+        
+        return self._response_text(response, "language model")
+
+    def chat_stream(self, messages: List[Mapping[str, Any]], timeout: Optional[int] = None) -> Iterator[str]:
+        """
+        Send chat messages to the LLM and yield the response text as it is generated.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            timeout: Optional timeout in seconds. If None, uses settings.llm_timeout_seconds
+        
+        Yields:
+            Non-empty pieces of the assistant's response text, in order
+            
+        Raises:
+            TimeoutError: If the LLM call exceeds the timeout
+            RuntimeError: If the call fails
+        """
+        timeout_seconds = timeout if timeout is not None else settings.llm_timeout_seconds
+        kwargs = self._completion_kwargs(self.model, messages, timeout_seconds, stream=True)
+
+        try:
+            for chunk in completion(**kwargs):
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+        except (TimeoutError, litellm.exceptions.Timeout) as e:
+            raise self._chat_timeout_error(timeout_seconds) from e
+        except Exception as e:
+            # Re-raise other exceptions with context
+            raise RuntimeError(f"Error calling LLM API: {str(e)}") from e
 
     def analyze_image(
         self,
@@ -76,7 +248,7 @@ class LLMClient:
         Analyze an image using vision model.
         
         Args:
-            image_base64: Base64-encoded image data
+            image_base64: Base64-encoded image data, or a data: URL (used as is)
             prompt: Text prompt describing what to analyze
             model: Optional vision model override
             timeout: Optional timeout in seconds. If None, uses settings.vision_timeout_seconds
@@ -88,47 +260,57 @@ class LLMClient:
             TimeoutError: If the vision API call exceeds the timeout
             RuntimeError: If the response is invalid
         """
-        vision_model = model or settings.vision_model
         timeout_seconds = timeout if timeout is not None else settings.vision_timeout_seconds
-        
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
-                    },
-                ],
-            }
-        ]
-        
-        kwargs = {
-            "model": vision_model,
-            "messages": messages,
-            "temperature": self.temperature,
-            "timeout": timeout_seconds,
-        }
-        if self.api_key:
-            kwargs["api_key"] = self.api_key
-        if self.api_base:
-            kwargs["api_base"] = self.api_base
+        kwargs = self._completion_kwargs(
+            model or settings.vision_model, self._vision_messages(image_base64, prompt), timeout_seconds
+        )
 
         try:
             response = completion(**kwargs)
         except (TimeoutError, litellm.exceptions.Timeout) as e:
-            raise TimeoutError(
-                f"Vision API call timed out after {timeout_seconds} seconds. "
-                "Image analysis took too long. Please try again with a smaller image or different prompt."
-            ) from e
+            raise self._vision_timeout_error(timeout_seconds) from e
         except Exception as e:
             # Re-raise other exceptions with context
             raise RuntimeError(f"Error calling vision API: {str(e)}") from e
         
-        if not response or "choices" not in response:
-            raise RuntimeError("No response from vision model")
-        return response["choices"][0]["message"]["content"].strip()
+        return self._response_text(response, "vision model")
 
+    async def aanalyze_image(
+        self,
+        image_base64: str,
+        prompt: str,
+        model: Optional[str] = None,
+        timeout: Optional[int] = None,
+    ) -> str:
+        """
+        Async version of analyze_image(): awaits the vision model without occupying a worker thread.
+        
+        Args:
+            image_base64: Base64-encoded image data, or a data: URL (used as is)
+            prompt: Text prompt describing what to analyze
+            model: Optional vision model override
+            timeout: Optional timeout in seconds. If None, uses settings.vision_timeout_seconds
+        
+        Returns:
+            The assistant's analysis text
+            
+        Raises:
+            TimeoutError: If the vision API call exceeds the timeout
+            RuntimeError: If the response is invalid
+        """
+        timeout_seconds = timeout if timeout is not None else settings.vision_timeout_seconds
+        kwargs = self._completion_kwargs(
+            model or settings.vision_model, self._vision_messages(image_base64, prompt), timeout_seconds
+        )
+
+        try:
+            response = await acompletion(**kwargs)
+        except (TimeoutError, litellm.exceptions.Timeout) as e:
+            raise self._vision_timeout_error(timeout_seconds) from e
+        except Exception as e:
+            # Re-raise other exceptions with context
+            raise RuntimeError(f"Error calling vision API: {str(e)}") from e
+        
+        return self._response_text(response, "vision model")
 
 llm_client = LLMClient()
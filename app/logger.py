@@ -1,12 +1,17 @@
 from __future__ import annotations
 
-import json
 import logging
+import os
+import queue
+import threading
+import time
 import uuid
 import warnings
 from datetime import datetime
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
 
 from app.config import settings
 
@@ -25,12 +30,73 @@ except ImportError:
     BotoCoreError = Exception
 
 
+# orjson writes UTF-8 bytes directly (non-ASCII unescaped, as json.dumps(ensure_ascii=False) did)
+# and appends the line's newline itself
+_JSONL_OPTIONS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+
+
+def _user_key(user_id: Optional[str]) -> str:
+    """Key for per-user bookkeeping (pending writes, cached history); "" for anonymous turns."""
+    return str(user_id).strip() if user_id else ""
+
+
+class _DailyJsonlFile:
+    """
+    Append-only handle on <log_dir>/<prefix>_<date>.jsonl, kept open between writes.
+    
+    The file is reopened only when the date changes, instead of an open/close per line.
+    Writes go straight to the O_APPEND descriptor, so each line lands whole and is
+    immediately visible to readers, including other worker processes.
+    """
+    
+    def __init__(self, log_dir: Path, prefix: str) -> None:
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.date_str: Optional[str] = None
+        self.fd: Optional[int] = None
+        self.lock = threading.Lock()
+    
+    def write(self, date_str: str, data: bytes) -> None:
+        """Append data to the file for date_str (YYYY-MM-DD)."""
+        with self.lock:
+            if date_str != self.date_str:
+                self._close()
+                path = self.log_dir / f"{self.prefix}_{date_str}.jsonl"
+                self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self.date_str = date_str
+            os.write(self.fd, data)
+    
+    def close(self) -> None:
+        """Close the file; the next write reopens it."""
+        with self.lock:
+            self._close()
+    
+    def _close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self.date_str = None
+
+
 class ConversationLogger:
     """Logs conversation details to files in logs/ directory and optionally to AWS S3."""
 
     def __init__(self, log_dir: Path | None = None) -> None:
         self.log_dir = log_dir or Path(__file__).resolve().parents[1] / "logs"
         self.log_dir.mkdir(exist_ok=True)
+        self.jsonl_file = _DailyJsonlFile(self.log_dir, "conversations")
+        
+        # Recently loaded user histories: user_id -> {(days, limit): (expires_at, turns)}.
+        # Cleared for a user whenever a new turn is logged for them.
+        self.history_cache: Dict[str, Dict[Tuple[int, int], Tuple[float, List[dict[str, str]]]]] = {}
+        self.history_cache_max_users = 1024
+        self.history_cache_lock = threading.Lock()
+        # Generation of each user's logged history, bumped whenever their cache is dropped, so a
+        # read that started before a new turn was logged doesn't cache what it loaded. Numbers
+        # come from one counter; users evicted to bound the dict fall back to history_generation_floor.
+        self.history_generations: Dict[str, int] = {}
+        self.history_generation_counter = 0
+        self.history_generation_floor = 0
         
         # Set up Python logging for application logs
         self.logger = logging.getLogger("vee_chatbot")
@@ -72,6 +138,93 @@ class ConversationLogger:
                 self.s3_client = None
         elif settings.aws_s3_bucket and not AWS_AVAILABLE:
             self.logger.warning("AWS S3 bucket configured but boto3 not installed. Install with: pip install boto3")
+        
+        # Conversation turns are written by a background thread, so serialization, disk I/O
+        # and application logging never hold up the request that logged the turn.
+        # log_pending counts queued turns per user; a read of a user's logs waits only for that
+        # user's turns to be written.
+        self.log_queue: Optional[queue.SimpleQueue] = queue.SimpleQueue()
+        self.log_pending: Dict[str, int] = {}
+        self.log_written = threading.Condition()
+        self.log_thread = threading.Thread(
+            target=self._log_writer_loop, args=(self.log_queue,), name="conversation-log-writer", daemon=True
+        )
+        self.log_thread.start()
+        
+        # S3 uploads (one network round trip each) are handed to a background thread so they
+        # never hold up the request that logged the turn
+        self.s3_queue: Optional[queue.Queue] = None
+        self.s3_thread: Optional[threading.Thread] = None
+        if self.s3_client:
+            self.s3_queue = queue.Queue(maxsize=1000)
+            self.s3_thread = threading.Thread(
+                target=self._s3_upload_loop, args=(self.s3_queue,), name="s3-log-uploader", daemon=True
+            )
+            self.s3_thread.start()
+
+    def _log_writer_loop(self, log_queue: queue.SimpleQueue) -> None:
+        """Write queued conversation turns until close() sends the None sentinel."""
+        while True:
+            item = log_queue.get()
+            if item is None:
+                return
+            try:
+                self._write_conversation(*item)
+            except Exception as e:
+                self.logger.warning(f"Failed to write conversation log: {e}")
+            finally:
+                user_key = _user_key(item[0]["user_id"])
+                with self.log_written:
+                    remaining = self.log_pending[user_key] - 1
+                    if remaining:
+                        self.log_pending[user_key] = remaining
+                    else:
+                        del self.log_pending[user_key]
+                        self.log_written.notify_all()
+
+    def _wait_for_log_writes(self, user_id: str, timeout: float = 5.0) -> None:
+        """Block until the user's queued conversation turns are on disk, so reads include them."""
+        user_key = _user_key(user_id)
+        with self.log_written:
+            self.log_written.wait_for(lambda: user_key not in self.log_pending, timeout)
+
+    def _s3_upload_loop(self, s3_queue: queue.Queue) -> None:
+        """Upload queued log entries until close() sends the None sentinel."""
+        while True:
+            item = s3_queue.get()
+            if item is None:
+                return
+            self._upload_to_s3(*item)
+
+    def _enqueue_s3_upload(self, log_entry: dict[str, Any], date_str: str) -> None:
+        """Queue a log entry for upload; uploads inline if the queue is full or closed."""
+        s3_queue = self.s3_queue
+        if s3_queue is not None:
+            try:
+                s3_queue.put_nowait((log_entry, date_str))
+                return
+            except queue.Full:
+                pass
+        self._upload_to_s3(log_entry, date_str)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Write pending conversation turns, finish pending S3 uploads and stop both background
+        threads. Turns logged afterwards are written synchronously.
+        
+        Args:
+            timeout: Maximum seconds to wait for each thread to finish its queue
+        """
+        log_queue, self.log_queue = self.log_queue, None
+        if log_queue is not None:
+            log_queue.put(None)
+            self.log_thread.join(timeout)
+        self.jsonl_file.close()
+        s3_queue, self.s3_queue = self.s3_queue, None
+        if s3_queue is None:
+            return
+        s3_queue.put(None)
+        self.s3_thread.join(timeout)
 
     def _upload_to_s3(self, log_entry: dict[str, Any], date_str: str) -> None:
         """Upload a log entry to S3 as a separate file. Fails silently if upload fails."""
@@ -97,7 +250,7 @@ class ConversationLogger:
             self.s3_client.put_object(
                 Bucket=self.s3_bucket,
                 Key=s3_key,
-                Body=json.dumps(log_entry, ensure_ascii=False, indent=2).encode("utf-8"),
+                Body=orjson.dumps(log_entry, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS),
                 ContentType="application/json",
             )
         except (ClientError, BotoCoreError) as e:
@@ -141,17 +294,55 @@ class ConversationLogger:
         if image_url:
             log_entry["image_url"] = image_url
         
-        # Log to JSON file (one file per day)
+        # Hand the entry to the writer thread
         date_str = datetime.utcnow().strftime("%Y-%m-%d")
-        json_log_file = self.log_dir / f"conversations_{date_str}.jsonl"
+        log_queue = self.log_queue
+        if log_queue is None:
+            self._write_conversation(log_entry, date_str)
+            return
+        user_key = _user_key(user_id)
+        with self.log_written:
+            self.log_pending[user_key] = self.log_pending.get(user_key, 0) + 1
+        # Until the writer has run, cached history must not be served; reads that miss the
+        # cache wait for pending writes
+        self._drop_cached_history(user_id)
+        log_queue.put((log_entry, date_str))
+
+    def _drop_cached_history(self, user_id: Optional[str]) -> None:
+        """Forget the cached logged history of a user and start a new generation of it."""
+        if user_id:
+            user_key = _user_key(user_id)
+            with self.history_cache_lock:
+                self.history_cache.pop(user_key, None)
+                self.history_generation_counter += 1
+                # Re-insert so the dict stays ordered by generation
+                self.history_generations.pop(user_key, None)
+                self.history_generations[user_key] = self.history_generation_counter
+                while len(self.history_generations) > self.history_cache_max_users:
+                    oldest = next(iter(self.history_generations))
+                    self.history_generation_floor = self.history_generations.pop(oldest)
+
+    def _history_generation(self, user_key: str) -> int:
+        """Current generation of a user's logged history. Caller holds history_cache_lock."""
+        return self.history_generations.get(user_key, self.history_generation_floor)
+
+    def _write_conversation(self, log_entry: dict[str, Any], date_str: str) -> None:
+        """Append a conversation turn to the day's JSON log, upload it to S3 and log a summary."""
+        # Log to JSON file (one file per day)
+        self.jsonl_file.write(date_str, orjson.dumps(log_entry, option=_JSONL_OPTIONS))
         
-        with open(json_log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        # Cached history for this user no longer includes the new turn
+        user_id = log_entry["user_id"]
+        self._drop_cached_history(user_id)
         
-        # Upload to S3 if configured
-        self._upload_to_s3(log_entry, date_str)
+        # Upload to S3 if configured (in the background)
+        self._enqueue_s3_upload(log_entry, date_str)
         
         # Also log to structured logger
+        is_food_related = log_entry["is_food_related"]
+        num_retrieved_docs = log_entry["num_retrieved_docs"]
+        history_length = log_entry["history_length"]
+        question = log_entry["question"]
         user_info = f"User: {user_id} | " if user_id else ""
         self.logger.info(
             f"Conversation logged | {user_info}"
@@ -174,6 +365,11 @@ class ConversationLogger:
         """
         Load user's past conversations from logs and convert to conversation turn format.
         
+        Results are cached per (user_id, days, limit) for settings.history_cache_ttl_seconds,
+        so a burst of requests from one user reads the log files once. Logging a new
+        turn for the user drops their cached entries, and a read that overlapped it
+        is returned without being cached.
+        
         Args:
             user_id: User identifier to filter by
             days: Number of days to look back. Use -1 for all history.
@@ -183,11 +379,37 @@ class ConversationLogger:
             List of conversation turns in format [{"user": "...", "assistant": "..."}]
             Sorted by timestamp (oldest first)
         """
-        from datetime import timedelta
-        
         if not user_id:
             return []
+        if settings.history_cache_ttl_seconds <= 0:
+            return self._read_user_history_as_turns(user_id, days, limit)
+        
+        user_key = _user_key(user_id)
+        cache_key = (int(days), limit)
+        now = time.monotonic()
+        with self.history_cache_lock:
+            entry = self.history_cache.get(user_key, {}).get(cache_key)
+            generation = self._history_generation(user_key)
+        if entry is not None and entry[0] > now:
+            return list(entry[1])
+        
+        turns = self._read_user_history_as_turns(user_id, days, limit)
+        with self.history_cache_lock:
+            # A turn logged while reading may be missing from turns: don't cache them
+            if self._history_generation(user_key) != generation:
+                return list(turns)
+            user_entries = self.history_cache.setdefault(user_key, {})
+            user_entries[cache_key] = (now + settings.history_cache_ttl_seconds, turns)
+            # Evict the oldest users once over capacity (dicts keep insertion order)
+            while len(self.history_cache) > self.history_cache_max_users:
+                del self.history_cache[next(iter(self.history_cache))]
+        return list(turns)
+    
+    def _read_user_history_as_turns(self, user_id: str, days: int, limit: int) -> List[dict[str, str]]:
+        """Read a user's turns from the daily conversation log files (uncached)."""
+        from datetime import timedelta
         
+        self._wait_for_log_writes(user_id)
         turns = []
         
         # Handle "all history" case (days = -1)
@@ -216,10 +438,10 @@ class ConversationLogger:
             
             if log_file.exists():
                 try:
-                    with open(log_file, "r", encoding="utf-8") as f:
+                    with open(log_file, "rb") as f:
                         for line in f:
                             try:
-                                entry = json.loads(line.strip())
+                                entry = orjson.loads(line)
                                 entry_user_id = entry.get("user_id")
                                 
                                 # Filter by user_id - normalize for comparison
@@ -257,7 +479,7 @@ class ConversationLogger:
                                     except (ValueError, KeyError) as e:
                                         # Skip entries with invalid timestamps
                                         continue
-                            except (json.JSONDecodeError, KeyError) as e:
+                            except (orjson.JSONDecodeError, KeyError) as e:
                                 # Skip malformed entries
                                 continue
                 except Exception as e:
@@ -303,6 +525,8 @@ class ConversationLogger:
         if not user_id:
             return []
         
+        self._wait_for_log_writes(user_id)
+        
         # Dictionary to group conversations by conversation_id
         conversations: dict[str, dict[str, Any]] = {}
         
@@ -323,10 +547,10 @@ class ConversationLogger:
             
             if log_file.exists():
                 try:
-                    with open(log_file, "r", encoding="utf-8") as f:
+                    with open(log_file, "rb") as f:
                         for line in f:
                             try:
-                                entry = json.loads(line.strip())
+                                entry = orjson.loads(line)
                                 entry_user_id = entry.get("user_id")
                                 entry_conversation_id = entry.get("conversation_id")
                                 
@@ -411,7 +635,7 @@ class ConversationLogger:
                                     # Increment message count
                                     conv["message_count"] += 1
                                     
-                            except (json.JSONDecodeError, KeyError):
+                            except (orjson.JSONDecodeError, KeyError):
                                 # Skip malformed entries
                                 continue
                 except Exception as e:
@@ -466,6 +690,8 @@ class ConversationLogger:
         if not conversation_id or not user_id:
             return []
         
+        self._wait_for_log_writes(user_id)
+        
         messages = []
         
         # Check up to 1 year of logs
@@ -485,10 +711,10 @@ class ConversationLogger:
             
             if log_file.exists():
                 try:
-                    with open(log_file, "r", encoding="utf-8") as f:
+                    with open(log_file, "rb") as f:
                         for line in f:
                             try:
-                                entry = json.loads(line.strip())
+                                entry = orjson.loads(line)
                                 entry_user_id = entry.get("user_id")
                                 entry_conversation_id = entry.get("conversation_id")
                                 
@@ -511,7 +737,7 @@ class ConversationLogger:
                                         message_dict["image_url"] = entry.get("image_url")
                                     messages.append(message_dict)
                                     
-                            except (json.JSONDecodeError, KeyError):
+                            except (orjson.JSONDecodeError, KeyError):
                                 # Skip malformed entries
                                 continue
                 except Exception as e:
@@ -538,6 +764,7 @@ class APILogger:
     def __init__(self, log_dir: Path | None = None) -> None:
         self.log_dir = log_dir or Path(__file__).resolve().parents[1] / "logs"
         self.log_dir.mkdir(exist_ok=True)
+        self.jsonl_file = _DailyJsonlFile(self.log_dir, "api_logs")
     
     def log_request_response(
         self,
@@ -554,7 +781,6 @@ class APILogger:
         """Log API request and response to JSONL file."""
         timestamp = datetime.utcnow().isoformat()
         date_str = datetime.utcnow().strftime("%Y-%m-%d")
-        log_file = self.log_dir / f"api_logs_{date_str}.jsonl"
         
         # Sanitize headers (remove sensitive data)
         safe_headers = {k: v for k, v in request_headers.items() 
@@ -576,8 +802,7 @@ class APILogger:
             "error": error,
         }
         
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        self.jsonl_file.write(date_str, orjson.dumps(log_entry, option=_JSONL_OPTIONS))
 
 
 # Global logger instances
@@ -157,8 +157,8 @@ class MySQLIngestor:
         # Convert to documents
         documents = self.table_to_documents(table_name, rows, columns)
         
-        # Add to vector store
-        vector_store.add(documents)
+        # Add to vector store (embedded in batches to bound peak memory)
+        vector_store.add_iter(documents)
         
         print(f"  ✅ Added {len(documents)} documents from {table_name}")
         return len(documents)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from app.config import settings
+from app.conversation_manager import turn_fields
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of chatbot answers with a time-to-live.
+    Identical questions with identical history skip the LLM round-trip.
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl_seconds: int = 300):
+        """
+        Initialize the response cache.
+        
+        Args:
+            max_size: Maximum number of cached answers (0 disables the cache)
+            ttl_seconds: Seconds before a cached answer expires
+        """
+        self.entries: OrderedDict[bytes, Tuple[float, str]] = OrderedDict()
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(user_id: Optional[str], question: str, history: Sequence[dict] | None) -> bytes:
+        """Build a compact cache key from the user, question and prior turns."""
+        turns = tuple(map(turn_fields, history or ()))
+        return hashlib.blake2b(repr((user_id, question, turns)).encode("utf-8"), digest_size=16).digest()
+    
+    def get(self, key: bytes) -> Optional[str]:
+        """Return the cached answer for key, or None if missing or expired."""
+        if self.max_size <= 0:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, answer = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return answer
+    
+    def set(self, key: bytes, answer: str) -> None:
+        """Store an answer, evicting the least recently used entries if full."""
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, answer)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Drop all cached answers."""
+        with self.lock:
+            self.entries.clear()
+
+
+# Global response cache instance
+response_cache = ResponseCache(
+    max_size=settings.response_cache_size,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+)
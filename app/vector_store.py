@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import logging
+import threading
 from dataclasses import dataclass
-from typing import Iterable, List, Sequence
+from itertools import islice
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
 
 from app.config import settings
 import chromadb
 from chromadb.api import Collection
 from chromadb.utils import embedding_functions
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class Document:
@@ -16,60 +23,250 @@ class Document:
     metadata: dict
 
 
+class _QueryBatch:
+    """Knowledge base queries from concurrent requests, executed in one Chroma call."""
+    
+    __slots__ = ("texts", "limits", "results", "full", "done")
+    
+    def __init__(self) -> None:
+        self.texts: List[str] = []
+        self.limits: List[int] = []
+        self.results: List[List[Document]] = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class _SemanticCache:
+    """
+    Knowledge base results keyed by query embedding.
+    
+    A query whose embedding has cosine similarity of at least the threshold with a cached
+    one reuses that query's documents, skipping the nearest-neighbour search. Embeddings
+    are kept L2-normalized in one matrix so a lookup is a single matrix-vector product.
+    The least recently used entry is replaced when the cache is full.
+    """
+    
+    def __init__(self, max_size: int, threshold: float) -> None:
+        self.max_size = max_size
+        self.threshold = threshold
+        self.matrix: Optional[np.ndarray] = None
+        self.results: List[List[Document]] = []
+        self.limits: List[int] = []
+        self.last_used: List[int] = []
+        self.clock = 0
+        self.version = 0
+        self.lock = threading.Lock()
+    
+    def lookup(self, embedding: np.ndarray, limit: int, version: int) -> Optional[List[Document]]:
+        """Return cached documents for a similar query with at least limit results, or None."""
+        with self.lock:
+            if not self._sync(version) or not self.results:
+                return None
+            scores = self.matrix[: len(self.results)] @ embedding
+            index = int(np.argmax(scores))
+            if scores[index] < self.threshold or self.limits[index] < limit:
+                return None
+            self.clock += 1
+            self.last_used[index] = self.clock
+            return self.results[index][:limit]
+    
+    def store(self, embedding: np.ndarray, limit: int, version: int, documents: List[Document]) -> None:
+        """Cache the documents found for a query embedding."""
+        with self.lock:
+            if not self._sync(version):
+                return
+            if self.matrix is None:
+                self.matrix = np.empty((self.max_size, embedding.shape[0]), dtype=np.float32)
+            if len(self.results) < self.max_size:
+                index = len(self.results)
+                self.results.append(documents)
+                self.limits.append(limit)
+                self.last_used.append(0)
+            else:
+                index = self.last_used.index(min(self.last_used))
+                self.results[index] = documents
+                self.limits[index] = limit
+            self.matrix[index] = embedding
+            self.clock += 1
+            self.last_used[index] = self.clock
+    
+    def _sync(self, version: int) -> bool:
+        """Drop entries from before a collection change; False if version itself is outdated."""
+        if version < self.version:
+            return False
+        if version > self.version:
+            self.results.clear()
+            self.limits.clear()
+            self.last_used.clear()
+            self.version = version
+        return True
+
+
 class VectorStore:
     """Thin wrapper around Chroma for persistence + retrieval."""
 
     def __init__(self) -> None:
         self.client = chromadb.PersistentClient(path=str(settings.chroma_path))
-        embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+        # Load the embedding model once and share it across collection resets
+        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
             model_name=settings.embedding_model
         )
         self.collection: Collection = self.client.get_or_create_collection(
             name=settings.collection_name,
-            embedding_function=embedding_fn,
+            embedding_function=self.embedding_fn,
+        )
+        # Bumped whenever the collection changes, so callers can key caches on it
+        self.version = 0
+        # Batch currently accepting queries, and how many batches are open or running (see query)
+        self._open_batch: Optional[_QueryBatch] = None
+        self._active_batches = 0
+        self._batch_lock = threading.Lock()
+        self._semantic_cache = (
+            _SemanticCache(settings.semantic_cache_size, settings.semantic_cache_threshold)
+            if settings.semantic_cache_size > 0
+            else None
         )
 
     def reset(self) -> None:
         self.client.delete_collection(settings.collection_name)
-        embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=settings.embedding_model
-        )
         self.collection = self.client.get_or_create_collection(
             name=settings.collection_name,
-            embedding_function=embedding_fn,
+            embedding_function=self.embedding_fn,
         )
+        self.version += 1
 
     def add(self, documents: Sequence[Document]) -> None:
         if not documents:
             return
+        # Chroma ignores ids it already holds, but only after embedding them;
+        # drop those up front so re-ingesting an unchanged dataset is a cheap no-op
+        existing = set(self.collection.get(ids=[doc.doc_id for doc in documents], include=[])["ids"])
+        if existing:
+            documents = [doc for doc in documents if doc.doc_id not in existing]
+            if not documents:
+                return
         self.collection.add(
             ids=[doc.doc_id for doc in documents],
             documents=[doc.content for doc in documents],
             metadatas=[doc.metadata for doc in documents],
         )
+        self.version += 1
+
+    def add_iter(self, documents: Iterable[Document], batch_size: int = 256) -> int:
+        """
+        Add documents from an iterable in batches of batch_size.
+        
+        Only one batch of documents and its embeddings is held at a time, so large
+        ingests don't materialize the whole corpus at once.
+        
+        Args:
+            documents: Documents to add; may be a generator
+            batch_size: Number of documents embedded and added per Chroma call
+            
+        Returns:
+            Number of documents consumed from the iterable
+        """
+        iterator = iter(documents)
+        total = 0
+        while batch := list(islice(iterator, batch_size)):
+            self.add(batch)
+            total += len(batch)
+        return total
 
     def query(self, text: str, n_results: int | None = None) -> List[Document]:
         """
         Query the vector store for similar documents.
         Returns empty list if query fails (e.g., due to ChromaDB compatibility issues).
+        
+        Queries arriving from concurrent requests within settings.retrieval_batch_wait_ms
+        are embedded and searched in a single Chroma call (up to settings.retrieval_batch_size).
+        The first caller of a batch waits for the others and runs it; the rest wait for their results.
+        A query with no other batch open or running runs at once, without waiting.
+        """
+        limit = n_results or settings.max_context_documents
+        if settings.retrieval_batch_size <= 1:
+            return self._query_batch([text], limit)[0]
+        
+        with self._batch_lock:
+            batch = self._open_batch
+            is_leader = batch is None or len(batch.texts) >= settings.retrieval_batch_size
+            if is_leader:
+                batch = self._open_batch = _QueryBatch()
+                # Only wait for company under real concurrency
+                wait_ms = settings.retrieval_batch_wait_ms if self._active_batches else 0
+                self._active_batches += 1
+            index = len(batch.texts)
+            batch.texts.append(text)
+            batch.limits.append(limit)
+            if len(batch.texts) >= settings.retrieval_batch_size:
+                batch.full.set()
+        
+        if is_leader:
+            # Give concurrent requests a moment to join, then close the batch and run it
+            if wait_ms:
+                batch.full.wait(wait_ms / 1000)
+            with self._batch_lock:
+                if self._open_batch is batch:
+                    self._open_batch = None
+            try:
+                batch.results = self._query_batch(batch.texts, max(batch.limits))
+            finally:
+                with self._batch_lock:
+                    self._active_batches -= 1
+                batch.done.set()
+        else:
+            batch.done.wait()
+        
+        if index >= len(batch.results):
+            return []
+        # Results are sorted by distance, so a smaller limit is a prefix of the batch's
+        return batch.results[index][:limit]
+
+    def _query_batch(self, texts: Sequence[str], n_results: int) -> List[List[Document]]:
+        """
+        Run one Chroma query for several texts, returning one document list per text.
+        Texts similar enough to a previous query reuse its documents (see _SemanticCache).
         """
         try:
-            limit = n_results or settings.max_context_documents
-            results = self.collection.query(query_texts=[text], n_results=limit)
-            docs: List[Document] = []
-            for doc_id, content, metadata in zip(
-                results.get("ids", [[]])[0],
-                results.get("documents", [[]])[0],
-                results.get("metadatas", [[]])[0],
-            ):
-                docs.append(Document(doc_id=doc_id, content=content, metadata=metadata))
-            return docs
+            if self._semantic_cache is None:
+                return self._to_documents(self.collection.query(query_texts=list(texts), n_results=n_results), len(texts))
+            
+            # Embed once: the embeddings serve both the cache lookup and the search
+            version = self.version
+            embeddings = np.asarray(self.embedding_fn(list(texts)), dtype=np.float32)
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            found = [self._semantic_cache.lookup(embedding, n_results, version) for embedding in embeddings]
+            misses = [index for index, documents in enumerate(found) if documents is None]
+            if misses:
+                searched = self._to_documents(
+                    self.collection.query(query_embeddings=embeddings[misses].tolist(), n_results=n_results),
+                    len(misses),
+                )
+                for index, documents in zip(misses, searched):
+                    found[index] = documents
+                    # Empty results may be a transient failure, so only cache hits
+                    if documents:
+                        self._semantic_cache.store(embeddings[index], n_results, version, documents)
+            return found
         except Exception as e:
             # Log the error but don't fail - allow chatbot to work without knowledge base
-            import logging
-            logger = logging.getLogger(__name__)
             logger.warning(f"Vector store query failed: {e}. Continuing without knowledge base context.")
-            return []
+            return [[] for _ in texts]
+
+    @staticmethod
+    def _to_documents(results: dict, count: int) -> List[List[Document]]:
+        """Convert a Chroma query result for count queries into one document list per query."""
+        return [
+            [
+                Document(doc_id=doc_id, content=content, metadata=metadata)
+                for doc_id, content, metadata in zip(ids, documents, metadatas)
+            ]
+            for ids, documents, metadatas in zip(
+                results.get("ids") or [[]] * count,
+                results.get("documents") or [[]] * count,
+                results.get("metadatas") or [[]] * count,
+            )
+        ]
 
 
 vector_store = VectorStore()
@@ -2,11 +2,17 @@ from __future__ import annotations
 
 import base64
 import io
+import re
+from functools import lru_cache
 from typing import Optional, Tuple
 
 from openai import OpenAI
 
 from app.config import settings
+from app.llm import http_client
+
+# Arabic script blocks, compiled once for the transcript language fallback
+_ARABIC_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
 
 
 class VoiceProcessor:
@@ -30,8 +36,9 @@ class VoiceProcessor:
         if not self.api_key:
             raise ValueError("OpenAI API key is required for voice processing")
         
-        # Initialize OpenAI client
-        client_kwargs = {"api_key": self.api_key}
+        # Initialize OpenAI client on the pooled HTTP client shared with LLM calls, so
+        # transcription and TTS reuse the same kept-alive connections to the provider
+        client_kwargs = {"api_key": self.api_key, "http_client": http_client}
         if self.api_base:
             client_kwargs["base_url"] = self.api_base
         self.client = OpenAI(**client_kwargs)
@@ -100,9 +107,7 @@ class VoiceProcessor:
             else:
                 # Try to detect from text content if language code not available
                 # Check if text contains Arabic characters
-                import re
-                arabic_pattern = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
-                if arabic_pattern.search(text):
+                if _ARABIC_RE.search(text):
                     language_code = "ar"
                 else:
                     language_code = "en"
@@ -215,14 +220,13 @@ class VoiceProcessor:
         return size_mb <= max_size_mb
 
 
-# Global voice processor instance
-_voice_processor: Optional[VoiceProcessor] = None
-
-
+@lru_cache(maxsize=1)
 def get_voice_processor() -> VoiceProcessor:
-    """Get or create global voice processor instance."""
-    global _voice_processor
-    if _voice_processor is None:
-        _voice_processor = VoiceProcessor()
-    return _voice_processor
+    """
+    Get or create the global voice processor instance.
+    
+    The instance is cached after the first successful call; a failed
+    initialization (e.g. missing API key) is not cached and raises again.
+    """
+    return VoiceProcessor()
 
@@ -0,0 +1,75 @@
+"""Tests for streamed chat answers passing through the API middleware."""
+
+import asyncio
+import json
+import threading
+
+import api.main as main
+
+
+def _call_asgi(app, path: str, body: bytes, on_body) -> None:
+    """Send one POST request straight to the ASGI app, calling on_body for every body chunk sent back."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 12345),
+        "server": ("testserver", 80),
+    }
+    received = False
+    
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Nothing else arrives until the client would disconnect
+        await asyncio.sleep(3600)
+    
+    async def send(message):
+        if message["type"] == "http.response.body":
+            on_body(message.get("body", b""))
+    
+    asyncio.run(app(scope, receive, send))
+
+
+def test_first_sse_event_arrives_before_generation_finishes(monkeypatch):
+    first_event_sent = threading.Event()
+    generation_finished = threading.Event()
+    
+    def answer_stream(message, **kwargs):
+        yield "first piece"
+        # Only continue once the client has seen the first piece (or give up)
+        first_event_sent.wait(timeout=5)
+        yield "second piece"
+        generation_finished.set()
+    
+    monkeypatch.setattr(main.bot, "answer_stream", answer_stream)
+    monkeypatch.setattr(main, "start_context_prefetch", lambda question: None)
+    monkeypatch.setattr(main.conversation_manager, "add_turn", lambda **kwargs: None)
+    
+    chunks: list[bytes] = []
+    finished_before_first_event: list[bool] = []
+    
+    def on_body(chunk: bytes) -> None:
+        if chunk and not chunks:
+            finished_before_first_event.append(generation_finished.is_set())
+            first_event_sent.set()
+        if chunk:
+            chunks.append(chunk)
+    
+    payload = json.dumps({"message": "hi", "user_id": "user-1", "history": []}).encode()
+    _call_asgi(main.app, "/chat/stream", payload, on_body)
+    
+    assert finished_before_first_event == [False]
+    assert b"first piece" in chunks[0]
+    body = b"".join(chunks)
+    assert b"second piece" in body
+    assert b"event: end" in body
@@ -0,0 +1,51 @@
+"""Tests for how the chatbot decides between canned replies and the LLM."""
+
+import uuid
+
+import pytest
+
+import app.chatbot as chatbot
+from app.chatbot import bot
+from app.prompts import GREETING_REPLY_EN, INTRO_REPLY_EN
+
+
+class _RecordingLLM:
+    """Stand-in LLM client that records the messages it is asked to answer."""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def chat(self, messages, timeout=None):
+        self.calls.append(messages)
+        return "llm answer"
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = _RecordingLLM()
+    monkeypatch.setattr(chatbot, "llm_client", fake)
+    monkeypatch.setattr(bot, "build_context", lambda question: [])
+    monkeypatch.setattr(chatbot.conversation_logger, "log_conversation", lambda **kwargs: None)
+    return fake
+
+
+def _ask(question, history=None):
+    # A fresh user per question, so the response cache never answers
+    return bot.answer(question, history=history, user_id=uuid.uuid4().hex)
+
+
+@pytest.mark.parametrize("question", [
+    "How do I make pasta?",
+    "Is chicken healthy?",
+    "كيف أطبخ الأرز؟",
+])
+def test_first_message_without_food_keyword_goes_to_llm(llm, question):
+    assert _ask(question) == "llm answer"
+    assert len(llm.calls) == 1
+    assert question in llm.calls[0][-1]["content"]
+
+
+def test_opening_greeting_gets_introduction_without_llm(llm):
+    assert _ask("Hello!") == INTRO_REPLY_EN
+    assert _ask("hello", history=[{"user": "Vegan recipes?", "assistant": "..."}]) == GREETING_REPLY_EN
+    assert llm.calls == []
@@ -0,0 +1,54 @@
+"""Tests for the Markdown to HTML renderer used by the /html endpoints."""
+
+import html
+import re
+
+import pytest
+
+from api.main import markdown_to_html
+
+
+def _regex_markdown_to_html(text: str) -> str:
+    """The original regex-based renderer, kept as the reference for plain inputs."""
+    html_content = re.sub(r'^### (.+)$', r'<h3>\1</h3>', text, flags=re.MULTILINE)
+    html_content = re.sub(r'^## (.+)$', r'<h2>\1</h2>', html_content, flags=re.MULTILINE)
+    html_content = re.sub(r'^# (.+)$', r'<h1>\1</h1>', html_content, flags=re.MULTILINE)
+    html_content = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html_content)
+    html_content = re.sub(r'(?<!\*)\*([^*]+?)\*(?!\*)', r'<em>\1</em>', html_content)
+    safe_html = html.escape(html_content).replace("\n", "<br>")
+    for tag in ("h1", "h2", "h3", "strong", "em"):
+        safe_html = safe_html.replace(f"&lt;{tag}&gt;", f"<{tag}>").replace(f"&lt;/{tag}&gt;", f"</{tag}>")
+    return safe_html
+
+
+@pytest.mark.parametrize("text", [
+    "Plain answer without formatting",
+    "Line one\nLine two",
+    "# Title\n## Section\n### Sub",
+    "**Ingredients:** flour and *fresh* eggs",
+    "*italic with **bold** inside*",
+    "**bold with *italic* inside**",
+    "### **Step 1:** mix *gently*",
+    "Price: 5 * 3",
+    "Open **bold without end",
+    "Tom & Jerry's <favourite> *cheese*",
+    "item #3 costs **$4**",
+    "**a***",
+    "**a** *b* **c***",
+])
+def test_matches_original_renderer(text):
+    assert markdown_to_html(text) == _regex_markdown_to_html(text)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("*italic with **bold** inside*", "<em>italic with <strong>bold</strong> inside</em>"),
+    ("***Important***", "<strong><em>Important</em></strong>"),
+    ("***a***", "<strong><em>a</em></strong>"),
+    ("**a***", "<strong>a</strong>*"),
+    ("**a****", "<strong>a</strong>**"),
+    ("**bold *italic***", "<strong>bold <em>italic</em></strong>"),
+    ("*italic **bold***", "<em>italic <strong>bold</strong></em>"),
+    ("# ***Warning***", "<h1><strong><em>Warning</em></strong></h1>"),
+])
+def test_nested_emphasis(text, expected):
+    assert markdown_to_html(text) == expected
@@ -0,0 +1,70 @@
+"""Tests for the request size guard on the upload endpoints."""
+
+import asyncio
+
+from api.main import RequestSizeLimitMiddleware
+
+
+LIMITS = {"/upload": (100, "Image too large. Maximum size: 1MB")}
+
+
+async def _body_reading_app(scope, receive, send):
+    """Stand-in endpoint that reads the whole body before answering 200."""
+    more_body = True
+    while more_body:
+        message = await receive()
+        more_body = message.get("more_body", False)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _post(app, path: str, chunks: list[bytes], headers: list[tuple[bytes, bytes]]) -> tuple[list[dict], int]:
+    """Post the chunks to the ASGI app; returns the sent messages and how many chunks were consumed."""
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers, "query_string": b""}
+    pending = list(chunks)
+    messages: list[dict] = []
+    
+    async def receive():
+        chunk = pending.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+    
+    async def send(message):
+        messages.append(message)
+    
+    asyncio.run(app(scope, receive, send))
+    return messages, len(chunks) - len(pending)
+
+
+def test_declared_oversized_body_is_rejected_before_reading():
+    app = RequestSizeLimitMiddleware(_body_reading_app, limits=LIMITS)
+    messages, consumed = _post(app, "/upload", [b"x" * 200], [(b"content-length", b"200")])
+    
+    assert messages[0]["status"] == 413
+    assert b"Image too large" in messages[1]["body"]
+    assert consumed == 0
+
+
+def test_chunked_body_is_cut_off_once_past_the_limit():
+    app = RequestSizeLimitMiddleware(_body_reading_app, limits=LIMITS)
+    messages, consumed = _post(app, "/upload", [b"x" * 60] * 10, [(b"transfer-encoding", b"chunked")])
+    
+    assert [m["status"] for m in messages if m["type"] == "http.response.start"] == [413]
+    assert consumed == 2
+
+
+def test_invalid_content_length_is_rejected():
+    app = RequestSizeLimitMiddleware(_body_reading_app, limits=LIMITS)
+    messages, consumed = _post(app, "/upload", [b"x"], [(b"content-length", b"abc")])
+    
+    assert messages[0]["status"] == 400
+    assert consumed == 0
+
+
+def test_small_bodies_and_other_paths_pass_through():
+    app = RequestSizeLimitMiddleware(_body_reading_app, limits=LIMITS)
+    
+    messages, _ = _post(app, "/upload", [b"x" * 50, b"x" * 50], [(b"transfer-encoding", b"chunked")])
+    assert messages[0]["status"] == 200
+    
+    messages, _ = _post(app, "/chat", [b"x" * 500], [(b"content-length", b"500")])
+    assert messages[0]["status"] == 200